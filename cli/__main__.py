@@ -1,17 +1,48 @@
 import sys
-from argparse import REMAINDER, SUPPRESS, ArgumentParser
+import time
+from argparse import REMAINDER, SUPPRESS, Action, ArgumentParser
 from logging import Formatter, StreamHandler, getLogger
 
-from metrico import MetricoCore, __version__
 from metrico.cli.cmd import MAIN_CMDS
 from metrico.const import DEFAULT_FILENAME
 
 logger = getLogger("metrico")
 
 
+class PackageVersion(Action):
+    """Print the installed version, read from the package metadata only when -V is given"""
+
+    def __init__(self, option_strings, dest=SUPPRESS, default=SUPPRESS, help="show program's version number and exit"):
+        super().__init__(option_strings, dest=dest, default=default, nargs=0, help=help)
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        from importlib.metadata import PackageNotFoundError, version
+
+        try:
+            text = version("metrico")
+        except PackageNotFoundError:
+            text = "unknown"
+        parser.exit(message=f"{text}\n")
+
+
+class LazyCore:
+    """Build the MetricoCore (config, database, hunters) on the first use, --help and argument errors don't need it"""
+
+    def __init__(self, filename: str):
+        self._filename = filename
+        self._core = None
+
+    def __getattr__(self, name: str):
+        if self._core is None:
+            from metrico import MetricoCore
+
+            self._core = MetricoCore(filename=self._filename)
+        return getattr(self._core, name)
+
+
 def main():
     parser = ArgumentParser(prog="metrico", description="Just some metrics stuff", epilog="build by axju")
-    parser.add_argument("-V", "--version", action="version", version=__version__)
+    parser.add_argument("-V", "--version", action=PackageVersion)
     parser.add_argument(
         "-v",
         "--verbose",
@@ -19,6 +50,8 @@ def main():
         help="verbose level... repeat up to three times",
     )
     parser.add_argument("-c", "--config", help="set the config file, default=metrico.toml")
+    parser.add_argument("--profile", action="store_true", help="print the statements, their time and the hunter latency at exit")
+    parser.add_argument("--profile_dump", help="write a cProfile dump, read it with python -m pstats")
     parser.add_argument(
         "cmd",
         nargs="?",
@@ -38,9 +71,20 @@ def main():
         logger.addHandler(handler)
 
     # metrico.config.load(filenames=DEFAULT_FILENAMES, log_except=False)
-    metrico = MetricoCore(filename=args.config or DEFAULT_FILENAME)
+    metrico = LazyCore(args.config or DEFAULT_FILENAME)
 
     if args.cmd:
+        instruments, profiler, start = None, None, time.perf_counter()
+        if args.profile:
+            from metrico.cli.instrument import Instruments, show_profile
+
+            instruments = Instruments(details=True)
+            instruments.install(metrico)
+        if args.profile_dump:
+            import cProfile
+
+            profiler = cProfile.Profile()
+            profiler.enable()
         try:
             func = None
             for name, item in MAIN_CMDS.items():
@@ -56,6 +100,13 @@ def main():
             logger.error('Oh no, a error :(\nError: "%s"', exc)
             logger.error("Run with --verbose for more information.")
             sys.exit(1)
+        finally:
+            if profiler:
+                profiler.disable()
+                profiler.dump_stats(args.profile_dump)
+            if instruments:
+                instruments.remove()
+                show_profile(instruments, time.perf_counter() - start)
 
     parser.print_help()
     sys.exit(0)
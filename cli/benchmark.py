@@ -0,0 +1,254 @@
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime
+from pathlib import Path
+
+from rich.table import Table
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+
+from metrico import MetricoCore
+from metrico import models
+from metrico.cli.cmd import show as show_cmd
+from metrico.cli.instrument import Instruments
+from metrico.cli.utils import console
+from metrico.database import alchemy
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+PLATFORM = "test"
+
+LISTING_LIMIT = 1000000
+
+MIN_REGRESSION = 0.05  # sec, smaller changes are noise
+
+SHOW_LISTINGS = {
+    "accounts": ["accounts", "--show_rel", "--show_dt"],
+    "medias": ["medias", "--show_rel", "--show_dt"],
+    "comments": ["comments"],
+    "growth": ["accounts", "--order_by", "growth_followers", "--window", "7d"],
+}
+
+
+class LineCounter:
+    def __init__(self):
+        self.lines = 0
+
+    def write(self, value: str):
+        self.lines += value.count("\n")
+
+    def flush(self):
+        pass
+
+
+class Recorder:
+    """Measure the phases of the scenarios: wall and cpu time, queries, flushes, commits, hunter time, rows/sec and memory"""
+
+    def __init__(self, database: str, instruments: Instruments, memory: bool):
+        self.database, self.instruments, self.memory = database, instruments, memory
+        self.results: list[dict] = []
+
+    @contextmanager
+    def phase(self, scenario: str, name: str):
+        result = {"database": self.database, "scenario": scenario, "phase": name, "rows": 0}
+        if self.memory:
+            tracemalloc.reset_peak()
+        before = self.instruments.snapshot()
+        wall, cpu = time.perf_counter(), time.process_time()
+        yield result
+        result["wall"] = time.perf_counter() - wall
+        result["cpu"] = time.process_time() - cpu
+        result.update({key: value - before[key] for key, value in self.instruments.snapshot().items()})
+        result["rows_per_sec"] = result["rows"] / result["wall"] if result["wall"] else 0.0
+        result["peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20 if self.memory else None
+        result["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource else None
+        self.results.append(result)
+        console.log(f"{scenario}/{name}: {result['wall']:.2f} sec, {result['queries']} queries, {result['rows_per_sec']:.1f} rows/sec")
+
+
+def ingest(metrico: MetricoCore, args, recorder: Recorder, state: dict):
+    with recorder.phase("ingest", "analyze") as phase:
+        datas = [data for data in metrico.hunter[PLATFORM].analyze("foo", amount=args.accounts) if isinstance(data, models.Account)]
+        phase["rows"] = len(datas)
+    with recorder.phase("ingest", "create") as phase:
+        state["account_ids"] = [metrico.db.create_account(PLATFORM, data).id for data in datas]
+        phase["rows"] = len(state["account_ids"])
+
+
+def update(metrico: MetricoCore, args, recorder: Recorder, state: dict):
+    with recorder.phase("update", "loops") as phase:
+        for _ in range(args.loops):
+            for account_id in state["account_ids"]:
+                metrico.update_account(account_id, media_count=args.media_count, comment_count=args.comment_count, subscription_count=args.subscription_count)
+        phase["rows"] = args.loops * len(state["account_ids"])
+
+
+def comments(metrico: MetricoCore, args, recorder: Recorder, state: dict):
+    hunter = metrico.hunter[PLATFORM]
+    hunter.config["max_comments"] = args.comments * args.comment_factor
+    with metrico.db.Session() as session:
+        media_ids = list(session.scalars(select(alchemy.Media.id).order_by(alchemy.Media.id)))
+    with recorder.phase("comments", "medias") as phase:
+        for media_id in media_ids:
+            metrico.update_media(media_id, comment_count=-1)
+        phase["rows"] = len(media_ids)
+    hunter.config["max_comments"] = args.comments
+
+
+def show(metrico: MetricoCore, args, recorder: Recorder, state: dict):
+    for name, argv in SHOW_LISTINGS.items():
+        output = LineCounter()
+        with recorder.phase("show", name) as phase, redirect_stdout(output):
+            show_cmd.main(metrico, *argv, "--limit", f"{LISTING_LIMIT}", "--format", "csv")
+        phase["rows"] = max(output.lines - 1, 0)
+
+
+SCENARIOS = {"ingest": ingest, "update": update, "comments": comments, "show": show}
+
+
+def compare(results: list[dict], filename: str, tolerance: float) -> int:
+    """Compare with a saved run, slower wall time or more queries than the tolerance allows are regressions"""
+    baseline = {(result["database"], result["scenario"], result["phase"]): result for result in json.loads(Path(filename).read_text())["results"]}
+    table = Table("Database", "Scenario", "Phase", "Wall [s]", "Baseline [s]", "Change", "Queries", "Baseline", title=f"Compared with {filename}")
+    regressions = 0
+    for result in results:
+        base = baseline.get((result["database"], result["scenario"], result["phase"]))
+        if base is None:
+            continue
+        change = result["wall"] / base["wall"] - 1 if base["wall"] else 0.0
+        slower = change > tolerance and result["wall"] - base["wall"] > MIN_REGRESSION
+        more_queries = result["queries"] > base["queries"] * (1 + tolerance)
+        regressions += slower or more_queries
+        table.add_row(
+            result["database"],
+            result["scenario"],
+            result["phase"],
+            f"{result['wall']:.3f}",
+            f"{base['wall']:.3f}",
+            f"{change:+.0%}",
+            f"{result['queries']}",
+            f"{base['queries']}",
+            style="red" if slower or more_queries else None,
+        )
+    console.print(table)
+    console.print(f"Regressions: {regressions}")
+    return 1 if regressions else 0
+
+
+def show_results(results: list[dict]):
+    table = Table("Database", "Scenario", "Phase", "Wall [s]", "CPU [s]", "Queries", "Query [s]", "Flushes", "Commits", "Hunter [s]", "Rows/sec", "Peak [MB]")
+    for result in results:
+        table.add_row(
+            result["database"],
+            result["scenario"],
+            result["phase"],
+            f"{result['wall']:.3f}",
+            f"{result['cpu']:.3f}",
+            f"{result['queries']}",
+            f"{result['query_time']:.3f}",
+            f"{result['flushes']}",
+            f"{result['commits']}",
+            f"{result['hunter_time']:.3f}",
+            f"{result['rows_per_sec']:.1f}",
+            "-" if result["peak_mb"] is None else f"{result['peak_mb']:.1f}",
+        )
+    console.print(table)
+
+
+def benchmark(metrico: MetricoCore, args) -> int:
+    databases = args.database or (["sqlite:///testing.db"] if args.sqlite else ["sqlite://"])
+    # every scenario works on the accounts of ingest, the scenarios run in the order of SCENARIOS
+    scenarios = [name for name in SCENARIOS if name == "ingest" or name in (args.scenario or SCENARIOS)]
+
+    metrico.hunter[PLATFORM].config["max_medias"] = args.medias
+    metrico.hunter[PLATFORM].config["max_comments"] = args.comments
+    metrico.hunter[PLATFORM].config["change_account_stats"] = 1
+    metrico.hunter[PLATFORM].config["change_media_stats"] = 1
+
+    # metrico.hunter[platform].config["random_medias"] = False
+    # metrico.hunter[platform].config["random_comments"] = False
+    #
+    # metrico.hunter[platform].config["medias_add"] = 1
+    # metrico.hunter[platform].config["change_account_name"] = 0
+    # metrico.hunter[platform].config["change_account_bio"] = 0
+    # metrico.hunter[platform].config["change_account_stats"] = 1
+    # metrico.hunter[platform].config["change_account_medias"] = 0
+    #
+    # metrico.hunter[platform].config["comments_add"] = 5
+    # metrico.hunter[platform].config["change_media_title"] = 0
+    # metrico.hunter[platform].config["change_media_caption"] = 1
+    # metrico.hunter[platform].config["change_media_stats"] = 1
+    # metrico.hunter[platform].config["change_media_comments"] = 0
+
+    console.log("Loops:", args.loops, "Accounts:", args.accounts, "Medias:", args.medias, "Comments:", args.comments)
+    console.log("Scenarios:", ", ".join(scenarios))
+
+    results: list[dict] = []
+    error = False
+    instruments = Instruments()
+    instruments.install(metrico)
+    if args.memory:
+        tracemalloc.start()
+    try:
+        for url in databases:
+            if url == "sqlite:///testing.db":
+                Path("testing.db").unlink(missing_ok=True)
+            database = make_url(url).render_as_string(hide_password=True)
+            console.log("Database:", database)
+            metrico.config.db.url = url
+            metrico.db.reload_config()
+            metrico.db.setup()
+            if any(metrico.db.stats().values()):
+                # the reference counts and the timings only hold for an empty database
+                console.print(f"The database {database} is not empty, use a new one for the benchmark")
+                return 1
+
+            recorder, state = Recorder(database, instruments, args.memory), {}
+            counted: dict[str, int] | None = None
+            for name in scenarios:
+                SCENARIOS[name](metrico, args, recorder, state)
+                if name == "update":
+                    # the reference counts are the rows of ingest and update, later scenarios add comments
+                    counted = metrico.db.stats()
+            results += recorder.results
+
+            stats = metrico.db.stats()
+            table = Table("", *stats.keys(), title=database)
+            table.add_row("DB", *[str(value) for value in stats.values()])
+            if counted is not None:
+                expected: dict[str, int] = {
+                    "Account": args.medias * args.comments + args.accounts,
+                    "Account-Info": args.medias * args.comments + args.accounts,
+                    "Account-Data": args.medias * args.comments + args.accounts + (args.loops * args.accounts),
+                    "Media": args.accounts * args.medias,
+                    "Media-Info": args.accounts * args.medias,
+                    "Media-Data": args.accounts * args.medias * args.loops,
+                    "Media-Comment": args.accounts * args.medias * args.comments,
+                    "Account-Subscription": 0,
+                }
+                error = error or any((counted[key] != expected[key] for key in counted))
+                if counted != stats:
+                    table.add_row("Update", *[str(counted.get(key, "")) for key in stats.keys()])
+                table.add_row("Ref", *[str(expected.get(key, "")) for key in stats.keys()])
+            console.print(table)
+    finally:
+        instruments.remove()
+        if args.memory:
+            tracemalloc.stop()
+
+    show_results(results)
+    console.print(f"Error:  {error}")
+    if args.output:
+        meta = {"date": datetime.now().isoformat(), "python": sys.version, "platform": platform.platform(), "argv": sys.argv[1:]}
+        Path(args.output).write_text(json.dumps({"meta": meta, "results": results}, indent=2))
+        console.log("Results:", args.output)
+    if args.compare:
+        return compare(results, args.compare, args.tolerance)
+    return 0
@@ -0,0 +1,241 @@
+from typing import Callable, Iterable, Iterator
+
+import logging
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+from threading import Event, Lock, Thread
+from uuid import uuid4
+
+from sqlalchemy import JSON, Boolean, Column, DateTime, ForeignKey, Integer, MetaData, String, Table, and_, func, insert, or_, select, update
+
+from metrico import MetricoCore
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+hunt_run = Table(
+    "cli_hunt_run",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("argv", JSON, nullable=False),
+    Column("started", DateTime, nullable=False),
+    Column("finished", DateTime),
+)
+
+hunt_run_item = Table(
+    "cli_hunt_run_item",
+    metadata,
+    Column("run_id", Integer, ForeignKey("cli_hunt_run.id"), primary_key=True),
+    Column("obj_id", Integer, primary_key=True),
+)
+
+hunt_task = Table(
+    "cli_hunt_task",
+    metadata,
+    Column("run_id", Integer, ForeignKey("cli_hunt_run.id"), primary_key=True),
+    Column("obj_id", Integer, primary_key=True),
+    Column("position", Integer, nullable=False),
+    Column("lease", String(128), index=True),
+    Column("lease_until", DateTime),
+    Column("done", Boolean, nullable=False, default=False),
+)
+
+
+def db_now(session) -> datetime:
+    """
+    Current time of the database as naive UTC, so the leases of workers on several machines use one clock.
+    SQLite's CURRENT_TIMESTAMP is UTC in whole seconds, PostgreSQL returns it with its time zone.
+    """
+    if session.get_bind().dialect.name == "sqlite":
+        return session.scalar(select(func.strftime("%Y-%m-%d %H:%M:%f", "now", type_=DateTime)))
+    now = session.scalar(select(func.current_timestamp(type_=DateTime)))
+    if now.tzinfo is not None:
+        now = now.astimezone(timezone.utc).replace(tzinfo=None)
+    return now
+
+
+class Checkpoint:
+    """Record the finished ids of a hunt run in the database, so a resumed run can skip them"""
+
+    flush_size = 50
+
+    def __init__(self, metrico: MetricoCore, run_id: int, done: set[int] | None = None):
+        self.metrico, self.run_id = metrico, run_id
+        self.done = done or set()
+        self.pending: list[int] = []
+        self.lock = Lock()
+
+    @classmethod
+    def start(cls, metrico: MetricoCore, argv: list[str]) -> "Checkpoint":
+        with metrico.db.Session() as session:
+            run_id = session.execute(insert(hunt_run).values(argv=argv, started=datetime.now())).inserted_primary_key[0]
+            session.commit()
+        return cls(metrico, run_id)
+
+    @classmethod
+    def resume(cls, metrico: MetricoCore, run_id: int) -> tuple["Checkpoint", list[str]]:
+        with metrico.db.Session() as session:
+            argv = session.scalar(select(hunt_run.c.argv).where(hunt_run.c.id == run_id))
+            if argv is None:
+                raise ValueError(f"No hunt run with id {run_id}")
+            done = set(session.scalars(select(hunt_run_item.c.obj_id).where(hunt_run_item.c.run_id == run_id)))
+        logger.info("Resume run %s, skip %s finished items", run_id, len(done))
+        return cls(metrico, run_id, done), argv
+
+    def wrap(self, update_func: Callable[..., None]) -> Callable[..., None]:
+        def update(obj_id: int, **kwargs):
+            if obj_id in self.done:
+                return None
+            result = update_func(obj_id, **kwargs)
+            self.add(obj_id)
+            return result
+
+        return update
+
+    def add(self, obj_id: int):
+        with self.lock:
+            self.done.add(obj_id)
+            self.pending.append(obj_id)
+            if len(self.pending) >= self.flush_size:
+                self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        with self.metrico.db.Session() as session:
+            session.execute(insert(hunt_run_item), [{"run_id": self.run_id, "obj_id": obj_id} for obj_id in self.pending])
+            session.commit()
+        self.pending = []
+
+    def close(self):
+        with self.lock:
+            self.flush()
+
+    def finish(self):
+        self.close()
+        with self.metrico.db.Session() as session:
+            session.execute(update(hunt_run).where(hunt_run.c.id == self.run_id).values(finished=datetime.now()))
+            session.commit()
+
+
+class LeaseQueue:
+    """
+    Hand out the items of a run to many workers, processes or machines, with expiring leases. Free items are
+    selected with FOR UPDATE SKIP LOCKED (PostgreSQL) and only taken if they are still free at the update, so
+    no item goes to two workers. A heartbeat renews the leases of the claimed items, an item is only updated and
+    marked done while its lease is held. Items of a dead worker are free again after the lease expired.
+    Leases are written and compared in the time of the database, the clocks of the workers don't matter.
+    """
+
+    insert_size = 1000
+
+    def __init__(self, metrico: MetricoCore, run_id: int, batch_size: int = 10, lease: timedelta = timedelta(minutes=10)):
+        self.metrico, self.run_id = metrico, run_id
+        self.batch_size, self.lease = batch_size, lease
+        self.token = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex}"
+        self.stop = Event()
+        self.heartbeat = Thread(target=self.renew_periodically, daemon=True)
+        self.heartbeat.start()
+
+    @classmethod
+    def create(cls, metrico: MetricoCore, argv: list[str], obj_ids: Iterable[int], **kwargs) -> "LeaseQueue":
+        with metrico.db.Session() as session:
+            run_id = session.execute(insert(hunt_run).values(argv=argv, started=datetime.now())).inserted_primary_key[0]
+            rows: list[dict] = []
+            for position, obj_id in enumerate(obj_ids):
+                rows.append({"run_id": run_id, "obj_id": obj_id, "position": position, "done": False})
+                if len(rows) >= cls.insert_size:
+                    session.execute(insert(hunt_task), rows)
+                    rows = []
+            if rows:
+                session.execute(insert(hunt_task), rows)
+            session.commit()
+        return cls(metrico, run_id, **kwargs)
+
+    @classmethod
+    def join(cls, metrico: MetricoCore, run_id: int, **kwargs) -> tuple["LeaseQueue", list[str]]:
+        with metrico.db.Session() as session:
+            argv = session.scalar(select(hunt_run.c.argv).where(hunt_run.c.id == run_id))
+        if argv is None:
+            raise ValueError(f"No hunt run with id {run_id}")
+        return cls(metrico, run_id, **kwargs), argv
+
+    def held(self, now: datetime):
+        return and_(hunt_task.c.run_id == self.run_id, hunt_task.c.lease == self.token, hunt_task.c.lease_until > now)
+
+    def claim(self) -> list[int] | None:
+        """Lease the next batch of free items, None if there are no free items left"""
+        with self.metrico.db.Session() as session:
+            now = db_now(session)
+            free = and_(
+                hunt_task.c.run_id == self.run_id,
+                hunt_task.c.done.is_(False),
+                or_(hunt_task.c.lease_until.is_(None), hunt_task.c.lease_until < now),
+            )
+            candidates = select(hunt_task.c.obj_id).where(free).order_by(hunt_task.c.position).limit(self.batch_size).with_for_update(skip_locked=True)
+            obj_ids = list(session.scalars(candidates))
+            if not obj_ids:
+                return None
+            session.execute(update(hunt_task).where(free, hunt_task.c.obj_id.in_(obj_ids)).values(lease=self.token, lease_until=now + self.lease))
+            claimed = list(session.scalars(select(hunt_task.c.obj_id).where(self.held(now), hunt_task.c.obj_id.in_(obj_ids))))
+            session.commit()
+        return claimed
+
+    def renew(self) -> int:
+        """Extend the leases of the claimed and not yet done items, expired ones may belong to another worker"""
+        with self.metrico.db.Session() as session:
+            now = db_now(session)
+            result = session.execute(update(hunt_task).where(self.held(now), hunt_task.c.done.is_(False)).values(lease_until=now + self.lease))
+            session.commit()
+        return result.rowcount
+
+    def renew_periodically(self):
+        while not self.stop.wait(self.lease.total_seconds() / 3):
+            try:
+                self.renew()
+            except Exception:
+                logger.exception("Could not renew the leases of run %s", self.run_id)
+
+    def holds(self, obj_id: int) -> bool:
+        with self.metrico.db.Session() as session:
+            return session.scalar(select(hunt_task.c.obj_id).where(self.held(db_now(session)), hunt_task.c.obj_id == obj_id)) is not None
+
+    def __iter__(self) -> Iterator[int]:
+        while (obj_ids := self.claim()) is not None:
+            yield from obj_ids
+
+    def wrap(self, update_func: Callable[..., None]) -> Callable[..., None]:
+        def update_task(obj_id: int, **kwargs):
+            if not self.holds(obj_id):
+                logger.warning("Lease of %s expired, it belongs to another worker now", obj_id)
+                return None
+            result = update_func(obj_id, **kwargs)
+            self.mark_done(obj_id)
+            return result
+
+        return update_task
+
+    def mark_done(self, obj_id: int):
+        with self.metrico.db.Session() as session:
+            result = session.execute(update(hunt_task).where(self.held(db_now(session)), hunt_task.c.obj_id == obj_id).values(done=True))
+            session.commit()
+        if result.rowcount == 0:
+            logger.warning("Lease of %s expired before it was marked done", obj_id)
+
+    def close(self):
+        """Stop the heartbeat and free the claimed items, which weren't updated, for the other workers"""
+        self.stop.set()
+        self.heartbeat.join()
+        with self.metrico.db.Session() as session:
+            free = and_(hunt_task.c.run_id == self.run_id, hunt_task.c.lease == self.token, hunt_task.c.done.is_(False))
+            session.execute(update(hunt_task).where(free).values(lease=None, lease_until=None))
+            session.commit()
+
+    def finish(self):
+        with self.metrico.db.Session() as session:
+            left = session.scalar(select(hunt_task.c.obj_id).where(hunt_task.c.run_id == self.run_id, hunt_task.c.done.is_(False)).limit(1))
+            if left is None:
+                session.execute(update(hunt_run).where(hunt_run.c.id == self.run_id).values(finished=datetime.now()))
+                session.commit()
@@ -1,11 +1,23 @@
-from . import add, hunt, show, tools
+from importlib import import_module
 
-__all__ = ["MAIN_CMDS", "add", "hunt", "show", "tools"]
+__all__ = ["MAIN_CMDS", "add", "daemon", "hunt", "show", "tools"]
 
+CMDS = ["add", "daemon", "hunt", "show", "tools"]
 
-MAIN_CMDS = {
-    "add": add.main,  # type: ignore
-    "hunt": hunt.main,
-    "show": show.main,  # type: ignore
-    "tools": tools.main,
-}
+
+def lazy_main(name: str):
+    """Import the command module on the first call, so the cli starts without rich, SQLAlchemy and the hunters"""
+
+    def main(metrico, *argv: str) -> int:
+        return import_module(f"{__name__}.{name}").main(metrico, *argv)
+
+    return main
+
+
+def __getattr__(name: str):
+    if name in CMDS:
+        return import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+MAIN_CMDS = {name: lazy_main(name) for name in CMDS}
@@ -0,0 +1,213 @@
+import logging
+import os
+import socket
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from rich.table import Table
+from sqlalchemy import Boolean, Column, DateTime, Float, ForeignKey, Integer, MetaData, String, and_, insert, or_, select, update
+from sqlalchemy import Table as SqlTable
+
+from metrico import MetricoCore
+from metrico.cli.checkpoint import db_now
+from metrico.cli.limits import limit_hunters, show_limits
+from metrico.cli.utils import MetricoArgumentParser, console, parse_timedelta
+from metrico.database import alchemy
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+trigger_schedule = SqlTable(
+    "cli_trigger_schedule",
+    metadata,
+    Column("trigger_id", Integer, ForeignKey(alchemy.Trigger.id), primary_key=True),
+    Column("interval", Float, nullable=False),
+    Column("threads", Integer, nullable=False),
+    Column("limit", Integer, nullable=False),
+    Column("enabled", Boolean, nullable=False),
+    Column("next_run", DateTime, nullable=False),
+    Column("runs", Integer, nullable=False, default=0),
+    Column("last_duration", Float),
+    Column("last_status", Integer),
+    Column("lease", String(128)),
+    Column("lease_until", DateTime),
+)
+
+
+def schedule(metrico: MetricoCore, args) -> int:
+    with metrico.db.Session() as session:
+        trigger_id = session.scalar(select(alchemy.Trigger.id).where(alchemy.Trigger.name == args.trigger))
+        if trigger_id is None:
+            console.print(f"No trigger with the name {args.trigger}")
+            return 1
+        values = {
+            "interval": args.interval.total_seconds(),
+            "threads": args.threads,
+            "limit": args.limit,
+            "enabled": not args.disable,
+            "next_run": datetime.now(),
+        }
+        if session.scalar(select(trigger_schedule.c.trigger_id).where(trigger_schedule.c.trigger_id == trigger_id)) is None:
+            session.execute(insert(trigger_schedule).values(trigger_id=trigger_id, runs=0, **values))
+        else:
+            session.execute(update(trigger_schedule).where(trigger_schedule.c.trigger_id == trigger_id).values(**values))
+        session.commit()
+    return 0
+
+
+def list_schedules(metrico: MetricoCore) -> int:
+    table = Table("ID", "Trigger", "Interval", "Threads", "Limit", "Enabled", "Next run", "Runs", "Last [s]", "Last status")
+    stmt = select(trigger_schedule, alchemy.Trigger.name).join(alchemy.Trigger, alchemy.Trigger.id == trigger_schedule.c.trigger_id)
+    with metrico.db.Session() as session:
+        for row in session.execute(stmt.order_by(trigger_schedule.c.next_run)).mappings():
+            table.add_row(
+                f"{row['trigger_id']}",
+                f"{row['name']}",
+                f"{timedelta(seconds=row['interval'])}",
+                f"{row['threads']}",
+                f"{row['limit']}",
+                f"{row['enabled']}",
+                f"{row['next_run']:%Y-%m-%d %H:%M:%S}",
+                f"{row['runs']}",
+                "-" if row["last_duration"] is None else f"{row['last_duration']:.2f}",
+                "-" if row["last_status"] is None else f"{row['last_status']}",
+            )
+    console.print(table)
+    return 0
+
+
+def claim_due(metrico: MetricoCore, running: dict, token: str, lease: timedelta) -> list[dict]:
+    """
+    Take the due schedules, which are not running in this daemon. The next run is moved and the schedule leased with
+    a conditional update, so a second daemon on the same database does not start the same trigger, also not while a
+    run takes longer than its interval. The lease is in the time of the database and renewed while the trigger runs.
+    """
+    now = datetime.now()
+    claimed = []
+    with metrico.db.Session() as session:
+        db_time = db_now(session)
+        free = or_(trigger_schedule.c.lease_until.is_(None), trigger_schedule.c.lease_until < db_time)
+        stmt = (
+            select(trigger_schedule, alchemy.Trigger.name)
+            .join(alchemy.Trigger, alchemy.Trigger.id == trigger_schedule.c.trigger_id)
+            .where(trigger_schedule.c.enabled.is_(True), trigger_schedule.c.next_run <= now, trigger_schedule.c.trigger_id.not_in(list(running)), free)
+        )
+        for row in session.execute(stmt).mappings().all():
+            next_run = row["next_run"] + timedelta(seconds=row["interval"])
+            if next_run <= now:
+                next_run = now + timedelta(seconds=row["interval"])
+            result = session.execute(
+                update(trigger_schedule)
+                .where(and_(trigger_schedule.c.trigger_id == row["trigger_id"], trigger_schedule.c.next_run == row["next_run"]), free)
+                .values(next_run=next_run, lease=token, lease_until=db_time + lease)
+            )
+            if result.rowcount == 1:
+                claimed.append(dict(row))
+        session.commit()
+    return claimed
+
+
+def renew_leases(metrico: MetricoCore, running: dict, token: str, lease: timedelta):
+    with metrico.db.Session() as session:
+        held = and_(trigger_schedule.c.trigger_id.in_(list(running)), trigger_schedule.c.lease == token)
+        session.execute(update(trigger_schedule).where(held).values(lease_until=db_now(session) + lease))
+        session.commit()
+
+
+def run_trigger(metrico: MetricoCore, row: dict, token: str, latencies: dict[str, list[tuple[float, bool]]]):
+    start = time.perf_counter()
+    try:
+        status = metrico.run_trigger(row["name"], threads=row["threads"], limit=row["limit"]) or 0
+    except Exception:
+        logger.exception("Trigger %s failed", row["name"])
+        status = 1
+    duration = time.perf_counter() - start
+    latencies.setdefault(row["name"], []).append((duration, status == 0))
+    with metrico.db.Session() as session:
+        held = and_(trigger_schedule.c.trigger_id == row["trigger_id"], trigger_schedule.c.lease == token)
+        session.execute(
+            update(trigger_schedule)
+            .where(held)
+            .values(runs=trigger_schedule.c.runs + 1, last_duration=duration, last_status=status, lease=None, lease_until=None)
+        )
+        session.commit()
+    if status:
+        console.log(f"Trigger {row['name']} failed with return code {status} after {duration:.2f} sec")
+    else:
+        console.log(f"Trigger {row['name']} finished in {duration:.2f} sec")
+
+
+def show_latencies(latencies: dict[str, list[tuple[float, bool]]]):
+    table = Table("Trigger", "Runs", "Failed", "Mean [s]", "Max [s]", "Last [s]", title="Trigger latency")
+    for name, results in sorted(latencies.items()):
+        durations = [duration for duration, _ in results]
+        failed = sum(1 for _, ok in results if not ok)
+        table.add_row(name, f"{len(durations)}", f"{failed}", f"{sum(durations) / len(durations):.2f}", f"{max(durations):.2f}", f"{durations[-1]:.2f}")
+    console.print(table)
+
+
+def run(metrico: MetricoCore, args) -> int:
+    """Run the scheduled triggers with one warm MetricoCore, its connection pool and hunter sessions are reused"""
+    limiters = limit_hunters(metrico)
+    running: dict[int, Future] = {}
+    latencies: dict[str, list[tuple[float, bool]]] = {}
+    token = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex}"
+    console.log(f"Daemon started, check every {args.tick} sec")
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        try:
+            while True:
+                for trigger_id in [trigger_id for trigger_id, future in running.items() if future.done()]:
+                    running.pop(trigger_id)
+                try:
+                    if running:
+                        renew_leases(metrico, running, token, args.lease)
+                    for row in claim_due(metrico, running, token, args.lease):
+                        console.log(f"Start trigger {row['name']}")
+                        running[row["trigger_id"]] = pool.submit(run_trigger, metrico, row, token, latencies)
+                except Exception:
+                    # e.g. the database is away for a moment, try again next tick
+                    logger.exception("Could not check the schedules")
+                time.sleep(args.tick)
+        except KeyboardInterrupt:
+            console.log(f"Stop, wait for {len(running)} running triggers")
+    show_latencies(latencies)
+    show_limits(limiters)
+    return 0
+
+
+def main(metrico: MetricoCore, *argv: str) -> int:
+    parser = MetricoArgumentParser("daemon")
+    subparsers = parser.add_subparsers(dest="action", help="sub-command help")
+
+    sub_run = subparsers.add_parser("run", help="Run the scheduled triggers")
+    sub_run.add_argument("--workers", type=int, default=4, help="Triggers running at the same time, default=4")
+    sub_run.add_argument("--tick", type=float, default=1.0, help="Seconds between the schedule checks, default=1")
+    sub_run.add_argument("--lease", type=parse_timedelta, default="10m", help="Lease of a running trigger, renewed every tick, default=10m")
+
+    sub_schedule = subparsers.add_parser("schedule", help="Add or change the schedule of a trigger")
+    sub_schedule.add_argument("trigger", type=str)
+    sub_schedule.add_argument("interval", type=parse_timedelta, help="e.g. 30m, 1h or 1d")
+    sub_schedule.add_argument("--threads", type=int, default=8)
+    sub_schedule.add_argument("--limit", type=int, default=100)
+    sub_schedule.add_argument("--disable", action="store_true")
+
+    subparsers.add_parser("list", help="Show the schedules")
+
+    args = parser.parse_args(*argv)
+    match args.action:
+        case "run":
+            return run(metrico, args)
+        case "schedule":
+            return schedule(metrico, args)
+        case "list":
+            return list_schedules(metrico)
+        case _:
+            parser.print_help()
+            return 1
+
+
+if __name__ == "__main__":
+    main(MetricoCore.default())
@@ -1,26 +1,75 @@
-from typing import Any, Callable
+from typing import Any, Callable, Iterable
 
+import heapq
 import logging
+import time
+from datetime import datetime
+from queue import Queue
+from threading import Thread
+
+from sqlalchemy import case, func, select
 
 from metrico import MetricoCore
-from metrico.cli.utils import MetricoArgumentParser, parser_add_argument_account_filter, parser_add_argument_media_filter
+from metrico.cli.checkpoint import Checkpoint, LeaseQueue
+from metrico.cli.compact import StatsCompactor
+from metrico.cli.limits import limit_hunters, show_limits
+from metrico.cli.metrics import HuntMetrics
+from metrico.cli.rollup import RESOLUTIONS, ROLLUPS, rollup
+from metrico.cli.utils import (
+    ACCOUNT_GROWTH,
+    MEDIA_GROWTH,
+    MetricoArgumentParser,
+    parse_timedelta,
+    parser_add_argument_account_filter,
+    parser_add_argument_media_filter,
+)
+from metrico.database import alchemy
 from metrico.database.query import AccountQuery, MediaQuery
 from metrico.utils import update_list
 
 logger = logging.getLogger(__name__)
 
 
+SCHEDULE_BATCH = 1000
+QUERY_LIMIT = 20
+
+
+def parser_add_argument_schedule(parser):
+    parser.add_argument("--schedule", choices=["query", "stale"], default="query", help="stale: most outdated and fastest changing first")
+    parser.add_argument("--budget", type=int, help="Update only the top items of the stale schedule, which ranks all filtered items")
+    parser.add_argument("--time_budget", type=parse_timedelta, help="Stop starting updates after this time, e.g. 30m")
+    parser.add_argument("--velocity_window", type=parse_timedelta, default="24h", help="Window for the stats velocity, default=24h")
+    # the stale schedule ranks every filtered item and --budget cuts, --limit stays 20 for the query schedule
+    parser.set_defaults(limit=None)
+    return parser
+
+
 def get_args(*argv: str):
     parser = MetricoArgumentParser("hunt")
 
     subparsers = parser.add_subparsers(dest="action", help="sub-command help")
     parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--checkpoint", action="store_true", help="Record the finished items, so the run can be resumed")
+    parser.add_argument("--resume", type=int, help="Resume a checkpoint run, skip its finished items")
+    parser.add_argument("--distribute", action="store_true", help="Put the items into a lease queue, more workers can --join the run")
+    parser.add_argument("--join", type=int, help="Work on the items of a distributed run")
+    parser.add_argument("--lease", type=parse_timedelta, default="10m", help="Lease time of claimed items, renewed while the worker runs, default=10m")
+    parser.add_argument("--lease_batch", type=int, default=10, help="Items claimed at once, default=10")
+    parser.add_argument("--changes_only", action="store_true", help="Keep new stats only if they changed, see tools compact")
+    parser.add_argument("--rollup", action="store_true", help="Update the stats rollups after the run, see tools rollup")
+    parser.add_argument(
+        "--queue_size", type=int, default=1000, help="Ids read ahead of the workers, 0=unlimited, at most --lease_batch in a distributed run, default=1000"
+    )
+    parser.add_argument("--progress", action="store_true", help="Show a live panel with throughput, latency and queue depth")
+    parser.add_argument("--metrics_file", type=str, help="Write the metrics to this Prometheus text file, e.g. for the node exporter")
+    parser.add_argument("--metrics_interval", type=parse_timedelta, default="15s", help="Time between the metrics file writes, default=15s")
 
     sub_accounts = subparsers.add_parser("accounts")
     sub_accounts = parser_add_argument_account_filter(sub_accounts)
     sub_accounts.add_argument("--media_count", type=int, default=-1)
     sub_accounts.add_argument("--comment_count", type=int, default=-1)
     sub_accounts.add_argument("--subscription_count", type=int, default=-1)
+    sub_accounts = parser_add_argument_schedule(sub_accounts)
 
     sub_account = subparsers.add_parser("account")
     sub_account.add_argument("--media_count", type=int, default=-2)
@@ -31,6 +80,7 @@ def get_args(*argv: str):
     sub_medias = subparsers.add_parser("medias")
     sub_medias = parser_add_argument_media_filter(sub_medias)
     sub_medias.add_argument("--comment_count", type=int, default=-1)
+    sub_medias = parser_add_argument_schedule(sub_medias)
 
     sub_media = subparsers.add_parser("media")
     sub_media.add_argument("--comment_count", type=int, default=-2)
@@ -40,11 +90,14 @@ def get_args(*argv: str):
     sub_trigger.add_argument("trigger", type=str)
     sub_trigger.add_argument("--limit", type=int)
 
-    return parser.parse_args(*argv)
+    args = parser.parse_args(*argv)
+    if getattr(args, "schedule", None) == "query" and args.limit is None:
+        args.limit = QUERY_LIMIT
+    return args
 
 
-def get_thread_data(metrico: MetricoCore, args) -> tuple[list[int], Callable[[int, Any], None], dict]:
-    obj_ids: list[int] = []
+def get_thread_data(metrico: MetricoCore, args) -> tuple[Iterable[int], Callable[[int, Any], None], dict]:
+    obj_ids: Iterable[int] = []
     update_func: Callable[[int, Any], None] = metrico.update_media
     kwargs = {"comment_count": args.comment_count}
 
@@ -58,13 +111,13 @@ def get_thread_data(metrico: MetricoCore, args) -> tuple[list[int], Callable[[in
 
     match args.action:
         case "accounts":
-            obj_ids = [obj.id for obj in metrico.db.iter_query(AccountQuery.from_namespace(args))]
+            obj_ids = (obj.id for obj in metrico.db.iter_query(AccountQuery.from_namespace(args)))
         case "account":
             account = metrico.db.get_account(args.account_id)
             if account:
                 obj_ids = [account.id]
         case "medias":
-            obj_ids = [obj.id for obj in metrico.db.iter_query(MediaQuery.from_namespace(args))]
+            obj_ids = (obj.id for obj in metrico.db.iter_query(MediaQuery.from_namespace(args)))
         case "media":
             media = metrico.db.get_media(args.media_id)
             if media:
@@ -80,14 +133,192 @@ def get_thread_data(metrico: MetricoCore, args) -> tuple[list[int], Callable[[in
     return obj_ids, update_func, kwargs
 
 
+def stale_scores(metrico: MetricoCore, args, obj_ids: list[int]) -> list[tuple[float, int]]:
+    """
+    Score = hours since the last update * (1 + relative change of the stats per day within the velocity window).
+    Never updated items come first.
+    """
+    if args.action == "accounts":
+        model, owner, fields = alchemy.Account, alchemy.AccountStats.account_id, ACCOUNT_GROWTH
+        last_update = model.stats_last_update
+    else:
+        model, owner, fields = alchemy.Media, alchemy.MediaStats.media_id, MEDIA_GROWTH
+        last_update = model.stats_last_update
+        if args.comment_count:
+            # never fetched comments are older than any stats
+            comments_last_update = func.coalesce(model.comments_last_update, datetime(1970, 1, 1))
+            last_update = case((comments_last_update < model.stats_last_update, comments_last_update), else_=model.stats_last_update)
+    stats = owner.class_
+    total = sum(func.coalesce(getattr(stats, field), 0) for field in fields)
+    numbered = (
+        select(
+            owner.label("owner_id"),
+            stats.timestamp,
+            total.label("total"),
+            func.row_number().over(partition_by=owner, order_by=stats.timestamp.asc()).label("first"),
+            func.row_number().over(partition_by=owner, order_by=stats.timestamp.desc()).label("last"),
+        )
+        .where(owner.in_(obj_ids), stats.timestamp >= datetime.now() - args.velocity_window)
+        .subquery()
+    )
+    velocity = (
+        select(
+            numbered.c.owner_id,
+            func.max(case((numbered.c.first == 1, numbered.c.total))).label("first_total"),
+            func.max(case((numbered.c.last == 1, numbered.c.total))).label("last_total"),
+            func.min(numbered.c.timestamp).label("first_timestamp"),
+            func.max(numbered.c.timestamp).label("last_timestamp"),
+        )
+        .group_by(numbered.c.owner_id)
+        .subquery()
+    )
+    stmt = select(model.id, last_update.label("last_update"), velocity).outerjoin(velocity, velocity.c.owner_id == model.id).where(model.id.in_(obj_ids))
+
+    now, scores = datetime.now(), []
+    with metrico.db.Session() as session:
+        for row in session.execute(stmt):
+            if row.last_update is None:
+                scores.append((float("inf"), row.id))
+                continue
+            age = max((now - row.last_update).total_seconds() / 3600, 0)
+            change = 0.0
+            if row.first_timestamp is not None and row.last_timestamp > row.first_timestamp:
+                days = (row.last_timestamp - row.first_timestamp).total_seconds() / 86400
+                change = abs(row.last_total - row.first_total) / max(row.first_total, 1) / days
+            scores.append((age * (1 + change), row.id))
+    return scores
+
+
+def schedule_stale(metrico: MetricoCore, args, obj_ids: Iterable[int]) -> list[int]:
+    obj_ids = list(obj_ids)
+    scores: list[tuple[float, int]] = []
+    for index in range(0, len(obj_ids), SCHEDULE_BATCH):
+        scores += stale_scores(metrico, args, obj_ids[index : index + SCHEDULE_BATCH])
+    return [obj_id for _, obj_id in heapq.nlargest(args.budget or len(scores), scores)]
+
+
+class Deadline:
+    """Time budget of a run: the feed of ids stops at the deadline, queued ids are dropped without an update"""
+
+    def __init__(self, seconds: float):
+        self.deadline = time.monotonic() + seconds
+        self.skipped = 0
+
+    def expired(self) -> bool:
+        return time.monotonic() > self.deadline
+
+    def ids(self, obj_ids: Iterable[int]) -> Iterable[int]:
+        for obj_id in obj_ids:
+            if self.expired():
+                logger.info("Time budget used, stop the feed before %s", obj_id)
+                return
+            yield obj_id
+
+    def wrap(self, update_func: Callable[..., None]) -> Callable[..., None]:
+        def update(obj_id: int, **kwargs):
+            if self.expired():
+                self.skipped += 1
+                return None
+            return update_func(obj_id, **kwargs)
+
+        return update
+
+    def close(self):
+        if self.skipped:
+            logger.info("Time budget used, dropped %s queued ids", self.skipped)
+
+
+def update_queue(obj_ids: Iterable[int], update_func: Callable[..., None], threads: int, queue_size: int, metrics: HuntMetrics | None = None, **kwargs):
+    """Feed the ids through a bounded queue to the worker threads, so they start with the first id"""
+    tasks: Queue = Queue(maxsize=queue_size)
+    if metrics:
+        metrics.queue = tasks
+
+    def worker():
+        while (obj_id := tasks.get()) is not None:
+            try:
+                update_func(obj_id, **kwargs)
+            except Exception as exc:
+                logger.error("Update of %s failed: %s", obj_id, exc)
+
+    workers = [Thread(target=worker, daemon=True) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for obj_id in obj_ids:
+        tasks.put(obj_id)
+    for _ in workers:
+        tasks.put(None)
+    for thread in workers:
+        thread.join()
+
+
 def main(metrico: MetricoCore, *argv: str) -> int:
     args = get_args(*argv)
-    if args.action == "trigger":
-        return metrico.run_trigger(args.trigger, threads=args.threads, limit=args.limit or 100)
+    checkpoint, queue, compactor, metrics, deadline = None, None, None, None, None
+    if args.resume:
+        checkpoint, argv = Checkpoint.resume(metrico, args.resume)
+        args = get_args(*argv)
+    if args.join:
+        queue, run_argv = LeaseQueue.join(metrico, args.join, batch_size=args.lease_batch, lease=args.lease)
+        args = get_args(*argv, *run_argv)
+    if args.progress or args.metrics_file:
+        metrics = HuntMetrics(args.action)
+        metrics.start(metrico, progress=args.progress, filename=args.metrics_file, interval=args.metrics_interval.total_seconds())
+    limiters = limit_hunters(metrico)
+    try:
+        if args.action == "trigger":
+            return metrico.run_trigger(args.trigger, threads=args.threads, limit=args.limit or 100)
 
-    obj_ids, update_func, kwargs = get_thread_data(metrico, args)
-    update_list(obj_ids, update_func, args.threads, **kwargs)
-    return 0
+        obj_ids, update_func, kwargs = get_thread_data(metrico, args)
+        if metrics:
+            # innermost, items skipped by the checkpoint, a lost lease or the time budget are not counted as done
+            update_func = metrics.wrap(update_func)
+        if checkpoint is None and args.checkpoint:
+            checkpoint = Checkpoint.start(metrico, list(argv))
+            print(f"Run {checkpoint.run_id}, resume it with: metrico hunt --resume {checkpoint.run_id}")
+        if checkpoint:
+            update_func = checkpoint.wrap(update_func)
+        if getattr(args, "schedule", None) == "stale":
+            obj_ids = schedule_stale(metrico, args, obj_ids)
+        if args.distribute and queue is None:
+            run_argv = list(argv[argv.index(args.action) :])
+            queue = LeaseQueue.create(metrico, run_argv, obj_ids, batch_size=args.lease_batch, lease=args.lease)
+            print(f"Run {queue.run_id}, add workers with: metrico hunt --join {queue.run_id}")
+        if queue:
+            obj_ids, update_func = queue, queue.wrap(update_func)
+        if args.changes_only:
+            compactor = StatsCompactor(metrico, args.action)
+            update_func = compactor.wrap(update_func)
+        if getattr(args, "time_budget", None):
+            deadline = Deadline(args.time_budget.total_seconds())
+            obj_ids, update_func = deadline.ids(obj_ids), deadline.wrap(update_func)
+        if isinstance(obj_ids, list):
+            update_list(obj_ids, update_func, args.threads, **kwargs)
+        else:
+            # claimed items wait at most one lease batch for a worker
+            queue_size = min(args.queue_size or args.lease_batch, args.lease_batch) if queue else args.queue_size
+            update_queue(obj_ids, update_func, args.threads, queue_size, metrics=metrics, **kwargs)
+        if checkpoint:
+            checkpoint.finish()
+        if queue:
+            queue.finish()
+        if args.rollup:
+            for name in ROLLUPS:
+                for resolution in RESOLUTIONS:
+                    rollup(metrico, name, resolution)
+        return 0
+    finally:
+        if checkpoint:
+            checkpoint.close()
+        if queue:
+            queue.close()
+        if compactor:
+            compactor.close()
+        if metrics:
+            metrics.close()
+        if deadline:
+            deadline.close()
+        show_limits(limiters)
 
 
 if __name__ == "__main__":
@@ -1,26 +1,289 @@
 # type: ignore
-from typing import Any
+from typing import Any, Callable
 
+import sys
 from datetime import datetime
+from enum import Enum
+from functools import partial
 from time import sleep
 
 from rich.live import Live
 from rich.table import Column, Table
-from sqlalchemy import func, select
+from sqlalchemy import and_, bindparam, case, distinct, extract, func, or_, select, text
+from sqlalchemy.orm import aliased
 
 from metrico import MetricoCore
 from metrico import models
+from metrico.cli.rollup import RESOLUTIONS, ROLLUP_TABLES
 from metrico.cli.utils import (
+    FIRST_PAGE,
+    FORMATS,
     MetricoArgumentParser,
+    StreamWriter,
+    open_table,
+    parse_cursor,
     parser_add_argument_account_filter,
+    parser_add_argument_cursor,
+    parser_add_argument_live,
     parser_add_argument_media_comment_filter,
     parser_add_argument_media_filter,
+    print_next_cursor,
 )
 from metrico.database import alchemy
 from metrico.database.query import AccountQuery, MediaCommentQuery, MediaQuery
 
+ACCOUNT_RELATIONS = {
+    "Stats": alchemy.AccountStats.account_id,
+    "Info": alchemy.AccountInfo.account_id,
+    "Comments": alchemy.MediaComment.account_id,
+    "Medias": alchemy.Media.account_id,
+    "Followers": alchemy.AccountSubscription.subscribed_account_id,
+    "Subscriptions": alchemy.AccountSubscription.account_id,
+}
 
-def list_account(metrico: MetricoCore, args):
+MEDIA_RELATIONS = {
+    "Comments": alchemy.MediaComment.media_id,
+    "Stats": alchemy.MediaStats.media_id,
+    "Info": alchemy.MediaInfo.media_id,
+}
+
+ACCOUNT_STATS = ["medias", "views", "followers", "subscriptions"]
+
+MEDIA_STATS = ["comments", "likes", "views"]
+
+BATCH_SIZE = 100
+
+# tools compact deletes from them, max(id) would count the removed rows
+COMPACTED_MODELS = [alchemy.AccountStats, alchemy.MediaStats]
+
+
+def count_relations(metrico: MetricoCore, model, relations: dict, raw: bool, ids: list[int]) -> dict[int, list]:
+    """Count the relationships of all given objects with one statement (correlated subqueries)"""
+    columns = [select(func.count()).where(column == model.id).scalar_subquery() for column in relations.values()]
+    stmt = select(model.id, *columns).where(model.id.in_(ids))
+    with metrico.db.Session() as session:
+        return {obj_id: list(counts) if raw else [f"{count:>3}" for count in counts] for obj_id, *counts in session.execute(stmt)}
+
+
+def stats_deltas(metrico: MetricoCore, owner, fields: list[str], delta: int, raw: bool, ids: list[int]) -> dict[int, list]:
+    """
+    Compare the latest stats with the stats about delta hours before (or the oldest one if delta is 0) in the
+    database. Same choice as find_index, but for all given objects with window functions.
+    """
+    model = owner.class_
+    numbered = (
+        select(
+            model,
+            func.row_number().over(partition_by=owner, order_by=model.timestamp.desc()).label("position"),
+            func.max(model.timestamp).over(partition_by=owner).label("latest"),
+        )
+        .where(owner.in_(ids))
+        .subquery()
+    )
+    if delta:
+        order_by = [func.abs(extract("epoch", numbered.c.latest) - extract("epoch", numbered.c.timestamp) - delta * 3600), numbered.c.position]
+    else:
+        order_by = [numbered.c.position.desc()]
+    ranked = (
+        select(numbered, func.row_number().over(partition_by=numbered.c[owner.key], order_by=order_by).label("rank")).where(numbered.c.position > 1).subquery()
+    )
+
+    results = {}
+    with metrico.db.Session() as session:
+        firsts = {row[owner.key]: row for row in session.execute(select(ranked).where(ranked.c.rank == 1)).mappings()}
+        for last in session.execute(select(numbered).where(numbered.c.position == 1)).mappings():
+            first = firsts.get(last[owner.key], last)
+            hours = (last["timestamp"] - first["timestamp"]).total_seconds() / 3600
+            changes = [(last[field] or 0) - (first[field] or 0) for field in fields]
+            if raw:
+                results[last[owner.key]] = [first["timestamp"], last["timestamp"], hours] + changes
+            else:
+                results[last[owner.key]] = [
+                    f"{first['timestamp']:%Y-%m-%d %H:%M}",
+                    f"{last['timestamp']:%Y-%m-%d %H:%M}",
+                    f"{hours:5.1f}",
+                ] + [f"{change}" for change in changes]
+    return results
+
+
+def listing_filters(model, args) -> tuple[list, list[str]]:
+    """
+    Where clauses of the filters, which the listings built here can express with the same meaning as the core
+    query, and the options of all others
+    """
+    clauses, unsupported = [], []
+    for name, value in sorted(vars(args).items()):
+        if not name.startswith("filter_") or not value:
+            continue
+        match name:
+            case "filter_status" if hasattr(model, "status"):
+                clauses.append(model.status == value)
+            case "filter_account_id" if model in (alchemy.Account, alchemy.Media):
+                clauses.append((model.id if model is alchemy.Account else model.account_id).in_(value))
+            case "filter_stats_views_null" if model is alchemy.Account:
+                clauses.append(model.stats_views.is_(None))
+            case "filter_media_account_id" if model is alchemy.MediaComment:
+                clauses.append(model.media_id.in_(select(alchemy.Media.id).where(alchemy.Media.account_id.in_(value))))
+            case _:
+                unsupported.append(f"--{name}")
+    return clauses, unsupported
+
+
+def order_key(model, args):
+    """Column of the order_by choice, None if it isn't a column of the model"""
+    if args.order_by is None:
+        return model.id
+    return model.__table__.c.get(args.order_by.name)
+
+
+def cursor_value(key, value: str):
+    """The key of a cursor in the python type of the order column"""
+    try:
+        python_type = key.type.python_type
+    except NotImplementedError:
+        return value
+    if issubclass(python_type, Enum):
+        return python_type[value]
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is bool:
+        return value == "True"
+    return python_type(value)
+
+
+def cursor_text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, Enum):
+        return value.name
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return f"{value}"
+
+
+def after_cursor(key, obj_id, cursor: str, ascending: bool):
+    """Rows behind the cursor "key,id" in the (key, id) order, NULL keys come last and have an empty key"""
+    value, after_id = parse_cursor(cursor)
+    beyond_id = obj_id > after_id if ascending else obj_id < after_id
+    if value == "":
+        return and_(key.is_(None), beyond_id)
+    value = cursor_value(key, value)
+    return or_(key > value if ascending else key < value, and_(key == value, beyond_id), key.is_(None))
+
+
+def listing_statement(parser, model, args, columns: list, joins: list):
+    """
+    Keyset listing for --after: the columns ordered by (order key, id), all filters in the statement. A page
+    continues after the cursor instead of scanning the skipped rows, the two last columns are the key and id of the
+    cursor. None without --after, then the core query lists the rows.
+    """
+    if not args.after:
+        return None
+    clauses, unsupported = listing_filters(model, args)
+    key = order_key(model, args)
+    if key is None:
+        unsupported.append(f"--order_by {args.order_by.name}")
+    if unsupported:
+        parser.error(f"--after can't be combined with {', '.join(unsupported)}")
+    if args.offset:
+        parser.error("--after replaces --offset, use only one of them")
+    stmt = select(*columns, key.label("cursor_key"), model.id.label("cursor_id"))
+    for target, onclause in joins:
+        stmt = stmt.join(target, onclause)
+    # NULL keys last on every database, NULLS LAST is not portable
+    if args.order_asc:
+        stmt = stmt.order_by(key.is_(None), key.asc(), model.id.asc())
+    else:
+        stmt = stmt.order_by(key.is_(None), key.desc(), model.id.desc())
+    stmt = stmt.where(*clauses)
+    if args.after != FIRST_PAGE:
+        stmt = stmt.where(after_cursor(key, model.id, args.after, args.order_asc))
+    if args.limit:
+        stmt = stmt.limit(args.limit)
+    if args.offset:
+        stmt = stmt.offset(args.offset)
+    return stmt
+
+
+def iter_statement(metrico: MetricoCore, stmt, args):
+    """Yield the rows of a listing_statement without the cursor columns, print the cursor after a full page"""
+    count, last = 0, None
+    with metrico.db.Session() as session:
+        for row in session.execute(stmt.execution_options(yield_per=BATCH_SIZE)):
+            count, last = count + 1, row
+            yield row[:-2]
+    if last is not None and count == args.limit:
+        print_next_cursor(cursor_text(last.cursor_key), last.cursor_id)
+
+
+def iter_growth(metrico: MetricoCore, model, owner, args, clauses: list, columns: list, joins: list):
+    """Yield (object, *columns, growth) ranked by the change of the stats field within the time window"""
+    stats = owner.class_
+    value = func.coalesce(getattr(stats, args.order_by.removeprefix("growth_")), 0)
+    numbered = (
+        select(
+            owner.label("owner_id"),
+            value.label("value"),
+            func.row_number().over(partition_by=owner, order_by=stats.timestamp.asc()).label("first"),
+            func.row_number().over(partition_by=owner, order_by=stats.timestamp.desc()).label("last"),
+        )
+        .where(stats.timestamp >= datetime.now() - args.window)
+        .subquery()
+    )
+    growth = func.max(case((numbered.c.last == 1, numbered.c.value))) - func.max(case((numbered.c.first == 1, numbered.c.value)))
+    ranked = select(numbered.c.owner_id, growth.label("growth")).group_by(numbered.c.owner_id).subquery()
+
+    stmt = select(model, *columns, ranked.c.growth).join(ranked, ranked.c.owner_id == model.id)
+    for target, onclause in joins:
+        stmt = stmt.join(target, onclause)
+    stmt = stmt.order_by(ranked.c.growth.asc() if args.order_asc else ranked.c.growth.desc(), model.id)
+    if args.after and args.after != FIRST_PAGE:
+        after_growth, after_id = parse_cursor(args.after)
+        beyond = ranked.c.growth > float(after_growth) if args.order_asc else ranked.c.growth < float(after_growth)
+        stmt = stmt.where(or_(beyond, and_(ranked.c.growth == float(after_growth), model.id > after_id)))
+    stmt = stmt.where(*clauses)
+    if args.limit:
+        stmt = stmt.limit(args.limit)
+    if args.offset:
+        stmt = stmt.offset(args.offset)
+    count, last = 0, None
+    with metrico.db.Session() as session:
+        for row in session.execute(stmt):
+            count, last = count + 1, row
+            yield row
+    if last is not None and count == args.limit:
+        print_next_cursor(last.growth, last[0].id)
+
+
+def iter_listing(metrico: MetricoCore, parser, query, model, owner, args, columns: list = (), joins: list = ()):
+    """
+    Yield (object, *columns, growth) of the accounts/medias listings, growth is None without a growth order. Growth
+    orders are ranked here, so they only take the filters listing_filters can express. With --after the listing is
+    built here with a keyset cursor, else the core query yields it and the columns are None.
+    """
+    if isinstance(args.order_by, str):
+        clauses, unsupported = listing_filters(model, args)
+        if unsupported:
+            parser.error(f"{', '.join(unsupported)} can't be combined with --order_by {args.order_by}")
+        return iter_growth(metrico, model, owner, args, clauses, list(columns), list(joins))
+    stmt = listing_statement(parser, model, args, [model, *columns], list(joins))
+    if stmt is not None:
+        return ((*row, None) for row in iter_statement(metrico, stmt, args))
+    return ((obj, *[None for _ in columns], None) for obj in metrico.db.iter_query(query.from_namespace(args)))
+
+
+def add_rows(table, rows: list[tuple[int, list]], extensions: list[tuple[Callable, int]]):
+    """Extend the rows with the columns of the extensions, (function of the ids, number of columns)"""
+    ids = [obj_id for obj_id, _ in rows]
+    columns = [(extension(ids), width) for extension, width in extensions] if ids else []
+    for obj_id, values in rows:
+        for column, width in columns:
+            values += column.get(obj_id, [None] * width)
+        table.add_row(*values)
+    rows.clear()
+
+
+def list_account(metrico: MetricoCore, parser, args):
     headers = [
         Column(header="ID", justify="right"),
         "Status",
@@ -31,55 +294,51 @@ def list_account(metrico: MetricoCore, args):
         Column(header="Followers", justify="right"),
         Column(header="Subscriptions", justify="right"),
     ]
+    fields = ["id", "status", "platform", "name"] + ACCOUNT_STATS
+    extensions = []
+    if isinstance(args.order_by, str):
+        headers.append(Column(header=f"Growth {args.order_by.removeprefix('growth_').title()}", justify="right"))
+        fields.append(args.order_by)
     if args.show_rel:
-        for name in ["Stats", "Info", "Comments", "Medias", "Followers", "Subscriptions"]:
+        for name in ACCOUNT_RELATIONS:
             headers.append(Column(header=name, justify="right"))
+        fields += [f"rel_{name.lower()}" for name in ACCOUNT_RELATIONS]
+        extensions.append((partial(count_relations, metrico, alchemy.Account, ACCOUNT_RELATIONS, bool(args.format)), len(ACCOUNT_RELATIONS)))
     if args.show_dt:
         for name in ["First", "Last", "DT [h]", "Medias", "Views", "Followers", "Subscriptions"]:
             headers.append(Column(header=name, justify="right"))
-    table = Table(
-        *headers,
+        fields += ["dt_first", "dt_last", "dt_hours"] + [f"dt_{name}" for name in ACCOUNT_STATS]
+        extensions.append((partial(stats_deltas, metrico, alchemy.AccountStats.account_id, ACCOUNT_STATS, args.dt, bool(args.format)), 3 + len(ACCOUNT_STATS)))
+    rows: list[tuple[int, list]] = []
+    listing = iter_listing(metrico, parser, AccountQuery, alchemy.Account, alchemy.AccountStats.account_id, args)
+    with open_table(
+        args,
+        headers,
+        fields,
         expand=True,
         style="magenta",
         show_lines=True,
         # row_styles=["magenta", "white on magenta dim"],
-    )
-    with Live(table, refresh_per_second=4):
-        account_query = AccountQuery.from_namespace(args)
-        for account in metrico.db.iter_query(account_query):
+    ) as table:
+        for account, growth in listing:
             values = [
-                f"{account.id}",
-                f"{account.status}",
-                f"{account.platform}",
-                f"{account.info_name or '-'}",
-                f"{account.stats_medias or '-'}",
-                f"{account.stats_views or '-'}",
-                f"{account.stats_followers or '-'}",
-                f"{account.stats_subscriptions or '-'}",
+                account.id,
+                account.status,
+                account.platform,
+                account.info_name,
+                account.stats_medias,
+                account.stats_views,
+                account.stats_followers,
+                account.stats_subscriptions,
             ]
-            if args.show_rel:
-                values += [
-                    f"{account.stats.count():>3}",
-                    f"{account.info.count():>3}",
-                    f"{account.comments.count()}",
-                    f"{account.medias.count()}",
-                    f"{account.followers.count()}",
-                    f"{account.subscriptions.count()}",
-                ]
-            if args.show_dt and account.stats.count():
-                index_dt = account.stats.count() - 1
-                if args.dt:
-                    index_dt = find_index(account.stats, args.dt)
-                values += [
-                    f"{account.stats[index_dt].timestamp:%Y-%m-%d %H:%M}",
-                    f"{account.stats[0].timestamp:%Y-%m-%d %H:%M}",
-                    f"{(account.stats[0].timestamp - account.stats[index_dt].timestamp).total_seconds() / 3600:5.1f}",
-                    f"{account.stats[0].medias - account.stats[index_dt].medias}",
-                    f"{(account.stats[0].views or 0) - (account.stats[index_dt].views or 0)}",
-                    f"{(account.stats[0].followers or 0) - (account.stats[index_dt].followers or 0)}",
-                    f"{(account.stats[0].subscriptions or 0) - (account.stats[index_dt].subscriptions or 0)}",
-                ]
-            table.add_row(*values)
+            if not args.format:
+                values = [f"{value or '-'}" for value in values]
+            if growth is not None:
+                values.append(growth if args.format else f"{growth}")
+            rows.append((account.id, values))
+            if len(rows) >= BATCH_SIZE:
+                add_rows(table, rows, extensions)
+        add_rows(table, rows, extensions)
 
 
 def find_index(stats, delta: int):
@@ -96,59 +355,159 @@ def find_index(stats, delta: int):
     return dt_index
 
 
-def list_media(metrico: MetricoCore, args):
-    headers = ["ID", "Created at", "Account", "Comments", "Likes", "Views", "Title"]
-    if args.show_rel:
-        headers += ["Comments", "Stats", "Info"]
-    if args.show_dt:
-        headers += ["First", "Last", "DT [h]", "Comments", "Likes", "Views"]
-
-    table = Table(*headers)
-    with Live(table, refresh_per_second=4):
-        for media in metrico.db.iter_query(MediaQuery.from_namespace(args)):
+def account_names(metrico: MetricoCore, ids: list[int]) -> dict[int, str]:
+    with metrico.db.Session() as session:
+        return dict(session.execute(select(alchemy.Account.id, alchemy.Account.info_name).where(alchemy.Account.id.in_(ids))).all())
+
+
+def add_media_rows(metrico: MetricoCore, table, page: list[tuple], extensions: list[tuple[Callable, int]], raw: bool):
+    """Medias of the core query come without the account name, it is looked up once per page"""
+    missing = [media.account_id for media, account_name, _ in page if account_name is None]
+    names = account_names(metrico, missing) if missing else {}
+    rows: list[tuple[int, list]] = []
+    for media, account_name, growth in page:
+        if account_name is None:
+            account_name = names.get(media.account_id) or ""
+        if raw:
+            values = [
+                media.id,
+                media.created_at,
+                media.account_id,
+                account_name,
+                media.stats_comments,
+                media.stats_likes,
+                media.stats_views,
+                media.info_title,
+            ]
+        else:
             values = [
                 f"{media.id}",
                 f"{media.created_at}",
-                f"[{media.account_id}] {media.account.info_name[:32]}",
+                f"[{media.account_id}] {account_name[:32]}",
                 f"{media.stats_comments or '-':>8}",
                 f"{media.stats_likes or '-':>8}",
                 f"{media.stats_views or '-':>8}",
                 f"{media.info_title[:32]}",
             ]
-            if args.show_rel:
-                values += [
-                    f"{media.comments.count():>5}",
-                    f"{media.stats.count():>3}",
-                    f"{media.info.count():>3}",
-                ]
-            if args.show_dt:
-                index_dt = media.stats.count() - 1
-                if args.dt:
-                    index_dt = find_index(media.stats, args.dt)
-                values += [
-                    f"{media.stats[index_dt].timestamp:%Y-%m-%d %H:%M}",
-                    f"{media.stats[0].timestamp:%Y-%m-%d %H:%M}",
-                    f"{(media.stats[0].timestamp - media.stats[index_dt].timestamp).total_seconds() / 3600:5.1f}",
-                    f"{media.stats[0].comments - media.stats[index_dt].comments}",
-                    f"{media.stats[0].likes - media.stats[index_dt].likes}",
-                    f"{media.stats[0].views - media.stats[index_dt].views}",
-                ]
-            table.add_row(*values)
-
-
-def list_media_comment(metrico: MetricoCore, args):
-    table = Table("ID", "Account", "Media", "Media-Account", "Created", "Likes", "Text")
-    with Live(table, refresh_per_second=4):
+        if growth is not None:
+            values.append(growth if raw else f"{growth}")
+        rows.append((media.id, values))
+    add_rows(table, rows, extensions)
+    page.clear()
+
+
+def list_media(metrico: MetricoCore, parser, args):
+    headers = ["ID", "Created at", "Account", "Comments", "Likes", "Views", "Title"]
+    fields = ["id", "created_at", "account_id", "account_name"] + MEDIA_STATS + ["title"]
+    extensions = []
+    if isinstance(args.order_by, str):
+        headers.append(f"Growth {args.order_by.removeprefix('growth_').title()}")
+        fields.append(args.order_by)
+    if args.show_rel:
+        headers += list(MEDIA_RELATIONS)
+        fields += [f"rel_{name.lower()}" for name in MEDIA_RELATIONS]
+        extensions.append((partial(count_relations, metrico, alchemy.Media, MEDIA_RELATIONS, bool(args.format)), len(MEDIA_RELATIONS)))
+    if args.show_dt:
+        headers += ["First", "Last", "DT [h]", "Comments", "Likes", "Views"]
+        fields += ["dt_first", "dt_last", "dt_hours"] + [f"dt_{name}" for name in MEDIA_STATS]
+        extensions.append((partial(stats_deltas, metrico, alchemy.MediaStats.media_id, MEDIA_STATS, args.dt, bool(args.format)), 3 + len(MEDIA_STATS)))
+
+    page: list[tuple] = []
+    account_name = func.coalesce(alchemy.Account.info_name, "")
+    joins = [(alchemy.Account, alchemy.Account.id == alchemy.Media.account_id)]
+    listing = iter_listing(metrico, parser, MediaQuery, alchemy.Media, alchemy.MediaStats.media_id, args, [account_name], joins)
+    with open_table(args, headers, fields) as table:
+        for row in listing:
+            page.append(row)
+            if len(page) >= BATCH_SIZE:
+                add_media_rows(metrico, table, page, extensions, bool(args.format))
+        add_media_rows(metrico, table, page, extensions, bool(args.format))
+
+
+def comment_listing(parser, args):
+    """Keyset listing of the comments with the names of the account, the media and its account in one joined projection"""
+    media_account = aliased(alchemy.Account)
+    columns = [
+        alchemy.MediaComment.id,
+        alchemy.MediaComment.account_id,
+        alchemy.Account.info_name.label("account_name"),
+        alchemy.MediaComment.media_id,
+        alchemy.Media.info_title.label("media_title"),
+        alchemy.Media.account_id.label("media_account_id"),
+        media_account.info_name.label("media_account_name"),
+        alchemy.MediaComment.created_at,
+        alchemy.MediaComment.likes,
+        alchemy.MediaComment.text,
+    ]
+    joins = [
+        (alchemy.Account, alchemy.Account.id == alchemy.MediaComment.account_id),
+        (alchemy.Media, alchemy.Media.id == alchemy.MediaComment.media_id),
+        (media_account, media_account.id == alchemy.Media.account_id),
+    ]
+    return listing_statement(parser, alchemy.MediaComment, args, columns, joins)
+
+
+def comment_names(metrico: MetricoCore, ids: list[int]) -> dict[int, Any]:
+    media_account = aliased(alchemy.Account)
+    stmt = (
+        select(
+            alchemy.MediaComment.id,
+            alchemy.Account.info_name.label("account_name"),
+            alchemy.Media.info_title.label("media_title"),
+            alchemy.Media.account_id.label("media_account_id"),
+            media_account.info_name.label("media_account_name"),
+        )
+        .join(alchemy.Account, alchemy.Account.id == alchemy.MediaComment.account_id)
+        .join(alchemy.Media, alchemy.Media.id == alchemy.MediaComment.media_id)
+        .join(media_account, media_account.id == alchemy.Media.account_id)
+        .where(alchemy.MediaComment.id.in_(ids))
+    )
+    with metrico.db.Session() as session:
+        return {row.id: row for row in session.execute(stmt)}
+
+
+def add_comment_row(table, row: tuple, raw: bool):
+    comment_id, account_id, account_name, media_id, media_title, media_account_id, media_account_name, created_at, likes, text = row
+    if raw:
+        table.add_row(*row)
+        return
+    table.add_row(
+        f"{comment_id:>7}",
+        f"[{account_id}] {(account_name or '')[:32]}",
+        f"[{media_id}] {(media_title or '')[:32]}",
+        f"[{media_account_id}] {(media_account_name or '')[:32]}",
+        f"{created_at}",
+        f"{likes}",
+        f"{text[:100]}",
+    )
+
+
+def add_comment_rows(metrico: MetricoCore, table, comments: list[tuple], raw: bool):
+    names = comment_names(metrico, [comment[0] for comment in comments]) if comments else {}
+    for comment_id, account_id, media_id, created_at, likes, text in comments:
+        name = names[comment_id]
+        row = (comment_id, account_id, name.account_name, media_id, name.media_title, name.media_account_id, name.media_account_name, created_at, likes, text)
+        add_comment_row(table, row, raw)
+    comments.clear()
+
+
+def list_media_comment(metrico: MetricoCore, parser, args):
+    headers = ["ID", "Account", "Media", "Media-Account", "Created", "Likes", "Text"]
+    fields = ["id", "account_id", "account_name", "media_id", "media_title", "media_account_id", "media_account_name", "created_at", "likes", "text"]
+    stmt = comment_listing(parser, args)
+    if stmt is not None:
+        with open_table(args, headers, fields) as table:
+            for row in iter_statement(metrico, stmt, args):
+                add_comment_row(table, tuple(row), bool(args.format))
+        return
+    # the core query lists the comments without --after, the names are added per page
+    comments: list[tuple] = []
+    with open_table(args, headers, fields) as table:
         for comment in metrico.db.iter_query(MediaCommentQuery.from_namespace(args)):
-            table.add_row(
-                f"{comment.id:>7}",
-                f"[{comment.account_id}] {comment.account.info_name[:32]}",
-                f"[{comment.media_id}] {comment.media.info_title[:32]}",
-                f"[{comment.media.account_id}] {comment.media.account.info_name[:32]}",
-                f"{comment.created_at}",
-                f"{comment.likes}",
-                f"{comment.text[:100]}",
-            )
+            comments.append((comment.id, comment.account_id, comment.media_id, comment.created_at, comment.likes, comment.text))
+            if len(comments) >= BATCH_SIZE:
+                add_comment_rows(metrico, table, comments, bool(args.format))
+        add_comment_rows(metrico, table, comments, bool(args.format))
 
 
 def account_info(metrico: MetricoCore, account: alchemy.Account):
@@ -172,15 +531,17 @@ def account_info(metrico: MetricoCore, account: alchemy.Account):
     account_stats_map = {
         "Media-Comments [rel]": select(func.count(alchemy.MediaComment.id)).join(alchemy.Media).where(alchemy.Media.account_id == account.id),
         "Media-Comments-Likes [rel]": select(func.sum(alchemy.MediaComment.likes)).join(alchemy.Media).where(alchemy.Media.account_id == account.id),
-        "Media-Comments-Accounts [rel]": select(alchemy.Account.id, func.count(alchemy.Account.id))
-        .join(alchemy.MediaComment, alchemy.Account.id == alchemy.MediaComment.account_id)
+        "Media-Comments-Accounts [rel]": select(func.count(distinct(alchemy.MediaComment.account_id)))
         .join(alchemy.Media, alchemy.Media.id == alchemy.MediaComment.media_id)
-        .where(alchemy.Media.account_id == account.id)
-        .group_by(alchemy.Account.id),
+        .where(alchemy.Media.account_id == account.id),
         "Media-Comments": select(func.sum(alchemy.Media.stats_comments)).where(alchemy.Media.account_id == account.id),
         "Media-Likes": select(func.sum(alchemy.Media.stats_likes)).where(alchemy.Media.account_id == account.id),
         "Media-Views": select(func.sum(alchemy.Media.stats_views)).where(alchemy.Media.account_id == account.id),
     }
+    relation_stmts = [select(func.count(model.id)).where(model.account_id == account.id) for model in account_relations.values()]
+    stmt = select(*[item.scalar_subquery() for item in relation_stmts + list(account_stats_map.values())])
+    with metrico.db.Session() as session:
+        values = session.execute(stmt).one()
 
     print(f"ID: {account.id} - Identifier: {account.identifier} - Platform: {account.platform}")
     print("Account Values:")
@@ -190,59 +551,109 @@ def account_info(metrico: MetricoCore, account: alchemy.Account):
 
     print("\nAccount Relations:")
     name_len = max(map(len, account_relations.keys())) + 1
-    with metrico.db.Session() as session:
-        for name, model in account_relations.items():
-            value = session.scalar(select(func.count(model.id)).where(model.account_id == account.id))
-            print(f"{name:>{name_len}}: {value}")
+    for name, value in zip(account_relations, values[: len(account_relations)]):
+        print(f"{name:>{name_len}}: {value}")
 
     print("\nAccount Stats:")
     name_len = max(map(len, account_stats_map.keys())) + 1
-    with metrico.db.Session() as session:
-        for name, stmt in account_stats_map.items():
-            value = session.scalar(stmt)
-            print(f"{name:>{name_len}}: {value}")
+    for name, value in zip(account_stats_map, values[len(account_relations) :]):
+        print(f"{name:>{name_len}}: {value}")
 
 
 def account_stats(metrico: MetricoCore, account: alchemy.Account, args):
     stmt = (
         select(alchemy.AccountStats)
         .where(alchemy.AccountStats.account_id == account.id)
-        .order_by(alchemy.AccountStats.timestamp.desc())
+        .order_by(alchemy.AccountStats.timestamp.desc(), alchemy.AccountStats.id.desc())
         .limit(args.limit or 10)
     )
-    table = Table("ID", "Timestamp", "Medias", "Views", "Followers", "Subscriptions")
-    with metrico.db.Session() as session, Live(table, refresh_per_second=4):
-        for stat in session.execute(stmt).scalars():
-            table.add_row(
-                f"{stat.id}",
-                f"{stat.timestamp}",
-                f"{stat.medias}",
-                f"{stat.views}",
-                f"{stat.followers}",
-                f"{stat.subscriptions}",
+    if args.after:
+        after_timestamp, after_id = parse_cursor(args.after)
+        after_timestamp = datetime.fromisoformat(after_timestamp)
+        stmt = stmt.where(
+            or_(
+                alchemy.AccountStats.timestamp < after_timestamp,
+                and_(alchemy.AccountStats.timestamp == after_timestamp, alchemy.AccountStats.id < after_id),
             )
+        )
+    count, last = 0, None
+    headers = ["ID", "Timestamp", "Medias", "Views", "Followers", "Subscriptions"]
+    with metrico.db.Session() as session, open_table(args, headers, ["id", "timestamp"] + ACCOUNT_STATS) as table:
+        for stat in session.execute(stmt).scalars():
+            values = [stat.id, stat.timestamp, stat.medias, stat.views, stat.followers, stat.subscriptions]
+            table.add_row(*(values if args.format else [f"{value}" for value in values]))
+            count, last = count + 1, stat
+    if last is not None and count == (args.limit or 10):
+        print_next_cursor(last.timestamp.isoformat(), last.id)
+
+
+def account_rollup(metrico: MetricoCore, account: alchemy.Account, args):
+    """Account stats per time bucket (min/max/last) from the rollup table, see tools rollup"""
+    table = ROLLUP_TABLES["account_stats"]
+    stmt = select(table).where(table.c.owner_id == account.id, table.c.resolution == args.resolution).order_by(table.c.bucket.desc()).limit(args.limit or 10)
+    if args.after:
+        stmt = stmt.where(table.c.bucket < datetime.fromisoformat(args.after))
+    count, last = 0, None
+    headers = ["Bucket", "Samples", "Medias", "Views", "Followers", "Subscriptions"]
+    fields = ["bucket", "samples"] + [f"{kind}_{field}" for field in ACCOUNT_STATS for kind in ("min", "max", "last")]
+    with metrico.db.Session() as session, open_table(args, headers, fields) as rich_table:
+        for row in session.execute(stmt).mappings():
+            if args.format:
+                rich_table.add_row(*[row[field] for field in fields])
+            else:
+                values = [f"{row['last_' + field] or '-'} [{row['min_' + field] or '-'}..{row['max_' + field] or '-'}]" for field in ACCOUNT_STATS]
+                rich_table.add_row(f"{row['bucket']:%Y-%m-%d %H:%M}", f"{row['samples']}", *values)
+            count, last = count + 1, row
+    if last is not None and count == (args.limit or 10):
+        print_next_cursor(last["bucket"].isoformat())
 
 
 def account_subscriptions(metrico: MetricoCore, account: alchemy.Account, args):
-    stmt = select(alchemy.AccountSubscription).where(alchemy.AccountSubscription.account_id == account.id).limit(args.limit or 10)
-    table = Table("ID", "Account")
-    with metrico.db.Session() as session, Live(table, refresh_per_second=4):
+    stmt = (
+        select(alchemy.AccountSubscription)
+        .where(alchemy.AccountSubscription.account_id == account.id)
+        .order_by(alchemy.AccountSubscription.id)
+        .limit(args.limit or 10)
+    )
+    if args.after:
+        stmt = stmt.where(alchemy.AccountSubscription.id > parse_cursor(args.after)[1])
+    count, last_id = 0, None
+    with metrico.db.Session() as session, open_table(args, ["ID", "Account"], ["id", "account_id", "account_name"]) as table:
         for subscription in session.execute(stmt).scalars():
-            table.add_row(
-                f"{subscription.id:>5}",
-                f"[{subscription.subscribed_account.id}] {subscription.subscribed_account.info_name}",
-            )
+            if args.format:
+                table.add_row(subscription.id, subscription.subscribed_account.id, subscription.subscribed_account.info_name)
+            else:
+                table.add_row(
+                    f"{subscription.id:>5}",
+                    f"[{subscription.subscribed_account.id}] {subscription.subscribed_account.info_name}",
+                )
+            count, last_id = count + 1, subscription.id
+    if last_id is not None and count == (args.limit or 10):
+        print_next_cursor(last_id)
 
 
 def account_followers(metrico: MetricoCore, account: alchemy.Account, args):
-    stmt = select(alchemy.AccountSubscription).where(alchemy.AccountSubscription.subscribed_account_id == account.id).limit(args.limit or 10)
-    table = Table("ID", "Account")
-    with metrico.db.Session() as session, Live(table, refresh_per_second=4):
+    stmt = (
+        select(alchemy.AccountSubscription)
+        .where(alchemy.AccountSubscription.subscribed_account_id == account.id)
+        .order_by(alchemy.AccountSubscription.id)
+        .limit(args.limit or 10)
+    )
+    if args.after:
+        stmt = stmt.where(alchemy.AccountSubscription.id > parse_cursor(args.after)[1])
+    count, last_id = 0, None
+    with metrico.db.Session() as session, open_table(args, ["ID", "Account"], ["id", "account_id", "account_name"]) as table:
         for follower in session.execute(stmt).scalars():
-            table.add_row(
-                f"{follower.id:>5}",
-                f"[{follower.account.id}] {follower.account.info_name}",
-            )
+            if args.format:
+                table.add_row(follower.id, follower.account.id, follower.account.info_name)
+            else:
+                table.add_row(
+                    f"{follower.id:>5}",
+                    f"[{follower.account.id}] {follower.account.info_name}",
+                )
+            count, last_id = count + 1, follower.id
+    if last_id is not None and count == (args.limit or 10):
+        print_next_cursor(last_id)
 
 
 def account_comments(metrico: MetricoCore, account: alchemy.Account, args):
@@ -255,10 +666,12 @@ def account_comments(metrico: MetricoCore, account: alchemy.Account, args):
         .order_by(func.count(alchemy.MediaComment.id).desc())
         .limit(args.limit or 10)
     )
-    table = Table("Count", "Account")
-    with metrico.db.Session() as session, Live(table, refresh_per_second=4):
+    with metrico.db.Session() as session, open_table(args, ["Count", "Account"], ["count", "account_id", "account_name"]) as table:
         for value, comments in session.execute(stmt).all():
-            table.add_row(f"{comments:>5}", f"[{value.id}] {value.info_name}")
+            if args.format:
+                table.add_row(comments, value.id, value.info_name)
+            else:
+                table.add_row(f"{comments:>5}", f"[{value.id}] {value.info_name}")
 
 
 def account_commented(metrico: MetricoCore, account: alchemy.Account, args):
@@ -270,9 +683,13 @@ def account_commented(metrico: MetricoCore, account: alchemy.Account, args):
         .order_by(func.count(alchemy.MediaComment.id).desc())
         .limit(args.limit or 10)
     )
-    table = Table("Count", "Account", "Media", "Media-Created")
-    with metrico.db.Session() as session, Live(table, refresh_per_second=4):
+    headers = ["Count", "Account", "Media", "Media-Created"]
+    fields = ["count", "account_id", "account_name", "media_id", "media_title", "media_created_at"]
+    with metrico.db.Session() as session, open_table(args, headers, fields) as table:
         for value, comments in session.execute(stmt).all():
+            if args.format:
+                table.add_row(comments, value.account.id, value.account.info_name, value.id, value.info_title, value.created_at)
+                continue
             table.add_row(
                 f"{comments:>5}",
                 f"[{value.account.id}] {value.account.info_name}",
@@ -336,13 +753,34 @@ def info_trigger(metrico: MetricoCore, trigger: alchemy.Trigger, args):
         stmt = select(func.count()).where(alchemy.TriggerAccount.trigger == trigger)
         total = session.scalar(stmt)
 
-    table = Table("ID", f"Account {args.limit} of {total}")
-    with Live(table, refresh_per_second=4):
+    with open_table(args, ["ID", f"Account {args.limit} of {total}"], ["id", "account_id", "account_name"]) as table:
         query = trigger.accounts.order_by(alchemy.TriggerAccount.timestamp.asc())
         if args.limit:
             query = query.limit(args.limit)
         for item in query:
-            table.add_row(f"{item.id}", f"[{item.account_id}] {item.account.info_name}")
+            if args.format:
+                table.add_row(item.id, item.account_id, item.account.info_name)
+            else:
+                table.add_row(f"{item.id}", f"[{item.account_id}] {item.account.info_name}")
+
+
+def table_counts(session, models_list: list, mode: str) -> list[int]:
+    """
+    Row counts of the tables in one round trip. "exact" runs count(*). "max_id" and "estimate" (planner statistics,
+    PostgreSQL only, otherwise max_id) don't scan the tables, but max_id still counts the compacted stats tables.
+    """
+    if mode == "estimate" and session.get_bind().dialect.name == "postgresql":
+        names = [model.__table__.name for model in models_list]
+        stmt = text("SELECT relname, reltuples::bigint FROM pg_class WHERE relname IN :names").bindparams(bindparam("names", expanding=True))
+        estimates = dict(session.execute(stmt, {"names": names}).all())
+        return [max(estimates.get(name) or 0, 0) for name in names]
+    columns = []
+    for model in models_list:
+        if mode == "exact" or model in COMPACTED_MODELS:
+            columns.append(select(func.count()).select_from(model).scalar_subquery())
+        else:
+            columns.append(select(func.coalesce(func.max(model.id), 0)).scalar_subquery())
+    return list(session.execute(select(*columns)).one())
 
 
 def stats_all(metrico: MetricoCore, args):
@@ -363,13 +801,28 @@ def stats_all(metrico: MetricoCore, args):
         "Media-Comment": alchemy.MediaComment,
     }
 
+    if args.format:
+        fields = ["timestamp"] + [name.lower().replace("-", "_") for name in alchemy_map]
+        with StreamWriter(args.format, fields) as writer:
+            while True:
+                try:
+                    with metrico.db.Session() as session:
+                        writer.add_row(datetime.now(), *table_counts(session, list(alchemy_map.values()), args.count))
+                    sys.stdout.flush()
+                    if not args.dynamic:
+                        break
+                    sleep(args.dt)
+                except KeyboardInterrupt:
+                    break
+        return
+
     rows: list[list[str]] = []
     values_last: list[Any] = []
     with Live() as live:
         while True:
             try:
                 with metrico.db.Session() as session:
-                    values = [datetime.now()] + [session.query(model).count() for name, model in alchemy_map.items()]
+                    values = [datetime.now()] + table_counts(session, list(alchemy_map.values()), args.count)
                     if values_last:
                         values_dt = [values[i] - values_last[i] for i in range(len(values))]
                         rows.append([f"{values[0]}"] + [f"{values[i]} [{values_dt[i]/values_dt[0].total_seconds():.2f}]" for i in range(1, len(values))])
@@ -396,13 +849,18 @@ def parse_args(*argv: str):
     subparsers = parser.add_subparsers(dest="action", help="sub-command help")
 
     sub_accounts = subparsers.add_parser("accounts")
-    parser_add_argument_account_filter(sub_accounts)
+    parser_add_argument_account_filter(sub_accounts, growth=True)
+    parser_add_argument_cursor(sub_accounts)
+    parser_add_argument_live(sub_accounts)
     sub_accounts.add_argument("--show_rel", action="store_true", help="Show length of relationship alchemy")
     sub_accounts.add_argument("--show_dt", action="store_true", help="Show stats changing")
     sub_accounts.add_argument("--dt", type=int, default=0, help="Set dt [h] for the changing stats")
 
     sub_account = subparsers.add_parser("account")
     sub_account.add_argument("--limit", type=int, default=10)
+    sub_account.add_argument("--after", type=str, help="Keyset cursor of the stats, subscriptions and followers modes, printed after a full page")
+    sub_account.add_argument("--resolution", choices=list(RESOLUTIONS), help="Stats per hour/day from the rollups, see tools rollup")
+    parser_add_argument_live(sub_account)
     sub_account.add_argument("account", type=int)
     sub_account.add_argument(
         "mode",
@@ -420,7 +878,9 @@ def parse_args(*argv: str):
     )
 
     sub_medias = subparsers.add_parser("medias")
-    sub_medias = parser_add_argument_media_filter(sub_medias)
+    sub_medias = parser_add_argument_media_filter(sub_medias, growth=True)
+    sub_medias = parser_add_argument_cursor(sub_medias)
+    sub_medias = parser_add_argument_live(sub_medias)
     sub_medias.add_argument("--show_rel", action="store_true", help="Show length of relationship models")
     sub_medias.add_argument("--show_dt", action="store_true", help="Show stats changing")
     sub_medias.add_argument("--dt", type=int, default=0, help="Set dt [h] for the changing stats")
@@ -440,6 +900,8 @@ def parse_args(*argv: str):
 
     sub_comments = subparsers.add_parser("comments")
     parser_add_argument_media_comment_filter(sub_comments)
+    parser_add_argument_cursor(sub_comments)
+    parser_add_argument_live(sub_comments)
 
     sub_triggers = subparsers.add_parser("triggers")
     sub_triggers.add_argument("--dynamic", action="store_true")
@@ -448,12 +910,20 @@ def parse_args(*argv: str):
 
     sub_trigger = subparsers.add_parser("trigger")
     sub_trigger.add_argument("--limit", type=int, default=10)
+    parser_add_argument_live(sub_trigger)
     sub_trigger.add_argument("triggers", type=int)
 
     sub_stats = subparsers.add_parser("stats")
     sub_stats.add_argument("--dynamic", action="store_true")
     sub_stats.add_argument("--limit", type=int, default=10)
     sub_stats.add_argument("--dt", type=int, default=2)
+    sub_stats.add_argument(
+        "--count",
+        choices=["max_id", "estimate", "exact"],
+        default="exact",
+        help="exact runs count(*), max_id and estimate don't scan the tables but are wrong after deletes, default=exact",
+    )
+    sub_stats.add_argument("--format", choices=FORMATS, help="Stream the counts to stdout instead of a table")
 
     return parser, parser.parse_args(*argv)
 
@@ -462,12 +932,14 @@ def main(metrico: MetricoCore, *argv: str) -> int:
     parser, args = parse_args(*argv)
     match args.action:
         case "accounts":
-            list_account(metrico, args)
+            list_account(metrico, parser, args)
         case "account":
             account = metrico.db.get_account(args.account)
             if account is None:
                 return 1
             match args.mode:
+                case "stats" if args.resolution:
+                    account_rollup(metrico, account, args)
                 case "stats":
                     account_stats(metrico, account, args)
                 case "subscriptions":
@@ -481,19 +953,19 @@ def main(metrico: MetricoCore, *argv: str) -> int:
                 case "info" | _:
                     account_info(metrico, account)
         case "medias":
-            list_media(metrico, args)
+            list_media(metrico, parser, args)
         case "media":
             with metrico.db.Session() as session:
                 media = metrico.db.get_media(args.media, session=session)
                 if media:
                     info_media(media)
         case "comments":
-            list_media_comment(metrico, args)
+            list_media_comment(metrico, parser, args)
         case "triggers":
             list_triggers(metrico, args)
-        case "triggers":
+        case "trigger":
             with metrico.db.Session() as session:
-                trigger = metrico.db.get_trigger(args.trigger, session=session)
+                trigger = metrico.db.get_trigger(args.triggers, session=session)
                 if trigger:
                     info_trigger(metrico, trigger, args)
         case "stats":
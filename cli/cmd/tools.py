@@ -1,14 +1,25 @@
 import random
 import string
 import time
-from pathlib import Path
+from datetime import datetime
 
 from rich import print as rich_print
-from rich.table import Table
+from sqlalchemy import select
 
 from metrico import MetricoCore
-from metrico import models
-from metrico.cli.utils import MetricoArgumentParser, console
+from metrico.cli import migrations
+from metrico.cli.compact import compact_stats
+from metrico.cli.rollup import RESOLUTIONS, ROLLUPS, rollup
+from metrico.cli.utils import MetricoArgumentParser, console, parse_timedelta, parser_add_argument_account_filter, parser_add_argument_media_filter
+from metrico.database import alchemy
+from metrico.database.query import AccountQuery, MediaQuery
+
+EXPORT_TABLES = {
+    "account_stats": (alchemy.AccountStats, alchemy.AccountStats.account_id, AccountQuery, parser_add_argument_account_filter),
+    "media_stats": (alchemy.MediaStats, alchemy.MediaStats.media_id, MediaQuery, parser_add_argument_media_filter),
+}
+
+EXPORT_ID_BATCH = 1000
 
 
 def get_random_string(length: int = 32) -> str:
@@ -29,83 +40,114 @@ def config(metrico: MetricoCore, args) -> int:
     return 0
 
 
-def benchmark(metrico: MetricoCore, args) -> int:
-    platform = "test"
-
-    metrico.config.db.url = "sqlite://"
-    if args.sqlite:
-        Path("testing.db").unlink(missing_ok=True)
-        metrico.config.db.url = "sqlite:///testing.db"
-    metrico.db.reload_config()
-
-    metrico.db.setup()
-    metrico.hunter[platform].config["max_medias"] = args.medias
-    metrico.hunter[platform].config["max_comments"] = args.comments
-    metrico.hunter[platform].config["change_account_stats"] = 1
-    metrico.hunter[platform].config["change_media_stats"] = 1
-
-    # metrico.hunter[platform].config["random_medias"] = False
-    # metrico.hunter[platform].config["random_comments"] = False
-    #
-    # metrico.hunter[platform].config["medias_add"] = 1
-    # metrico.hunter[platform].config["change_account_name"] = 0
-    # metrico.hunter[platform].config["change_account_bio"] = 0
-    # metrico.hunter[platform].config["change_account_stats"] = 1
-    # metrico.hunter[platform].config["change_account_medias"] = 0
-    #
-    # metrico.hunter[platform].config["comments_add"] = 5
-    # metrico.hunter[platform].config["change_media_title"] = 0
-    # metrico.hunter[platform].config["change_media_caption"] = 1
-    # metrico.hunter[platform].config["change_media_stats"] = 1
-    # metrico.hunter[platform].config["change_media_comments"] = 0
-
-    console.log("Loops:", args.loops, "Accounts:", args.accounts, "Medias:", args.medias, "Comments:", args.comments)
-    console.log("Database:", metrico.config.db.url)
-
-    start = time.time()
-    account_ids = []
-    for data in metrico.hunter[platform].analyze("foo", amount=args.accounts):
-        if isinstance(data, models.Account):
-            account = metrico.db.create_account(platform, data)
-            account_ids.append(account.id)
-
-    for loop in range(args.loops):
-        console.log(f"Running loop {loop}")
-        for account_id in account_ids:
-            metrico.update_account(account_id, media_count=args.media_count, comment_count=args.comment_count, subscription_count=args.subscription_count)
-
-    end = time.time()
-
-    stats = metrico.db.stats()
-    results: dict[str, int] = {
-        "Account": args.medias * args.comments + args.accounts,
-        "Account-Info": args.medias * args.comments + args.accounts,
-        "Account-Data": args.medias * args.comments + args.accounts + (args.loops * args.accounts),
-        "Media": args.accounts * args.medias,
-        "Media-Info": args.accounts * args.medias,
-        "Media-Data": args.accounts * args.medias * args.loops,
-        "Media-Comment": args.accounts * args.medias * args.comments,
-        "Account-Subscription": 0
-    }
-    error = any((stats[key] != results[key] for key in stats))
-
-    table = Table("", *stats.keys())
-    table.add_row("DB", *[str(value) for value in stats.values()])
-    table.add_row("Ref", *[str(results.get(key, "")) for key in stats.keys()])
-
-    console.print(table)
-    console.print(f"Result: {end - start:.2f} sec")
-    console.print(f"Error:  {error}")
+def export_batches(metrico: MetricoCore, stmt, chunk_size: int):
+    """Stream the rows of the statement with a server side cursor, one list of column tuples per chunk"""
+    with metrico.db.Session() as session:
+        result = session.execute(stmt.execution_options(stream_results=True))
+        for partition in result.partitions(chunk_size):
+            yield list(zip(*partition))
+
+
+def export(metrico: MetricoCore, args) -> int:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        console.print("The export needs pyarrow, install it with: pip install metrico[export]")
+        return 1
+
+    model, owner, query, _ = EXPORT_TABLES[args.table]
+    arrow_types = {int: pa.int64(), float: pa.float64(), bool: pa.bool_(), datetime: pa.timestamp("us"), str: pa.string()}
+    columns = list(model.__table__.columns)
+    fields = []
+    for column in columns:
+        try:
+            fields.append(pa.field(column.name, arrow_types.get(column.type.python_type, pa.string())))
+        except NotImplementedError:
+            fields.append(pa.field(column.name, pa.string()))
+    schema = pa.schema(fields)
+    stmt = select(*columns).order_by(owner, model.timestamp)
+
+    filtered = args.limit or args.offset or any(value for key, value in vars(args).items() if key.startswith("filter_"))
+    if filtered:
+
+        def iter_batches():
+            owner_ids: list[int] = []
+            for obj in metrico.db.iter_query(query.from_namespace(args)):
+                owner_ids.append(obj.id)
+                if len(owner_ids) >= EXPORT_ID_BATCH:
+                    yield from export_batches(metrico, stmt.where(owner.in_(owner_ids)), args.chunk_size)
+                    owner_ids = []
+            if owner_ids:
+                yield from export_batches(metrico, stmt.where(owner.in_(owner_ids)), args.chunk_size)
+
+        batches = iter_batches()
+    else:
+        batches = export_batches(metrico, stmt, args.chunk_size)
+
+    filename = args.output or f"{args.table}.{args.format}"
+    writer = pa.ipc.new_file(filename, schema) if args.format == "arrow" else pq.ParquetWriter(filename, schema)
+    rows, start = 0, time.time()
+    with writer:
+        for values in batches:
+            arrays = [pa.array(list(column), type=field.type) for column, field in zip(values, fields)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            rows += len(values[0])
+    console.log(f"Exported {rows} rows to {filename} in {time.time() - start:.2f} sec")
     return 0
 
 
+def compact(metrico: MetricoCore, args) -> int:
+    model, owner, _, _ = EXPORT_TABLES[args.table]
+    after, removed, start = args.after or 0, 0, time.time()
+    while True:
+        with metrico.db.Session() as session:
+            ids = list(session.scalars(select(owner).distinct().where(owner > after).order_by(owner).limit(args.chunk_size)))
+            if not ids:
+                break
+            removed += compact_stats(session, model, owner, ids)
+            session.commit()
+        after = ids[-1]
+        console.log(f"Compacted {args.table} up to {owner.key} {after} (resume with --after {after}), {removed} rows removed")
+    console.log(f"Removed {removed} unchanged rows from {args.table} in {time.time() - start:.2f} sec")
+    return 0
+
+
+def run_benchmark(metrico: MetricoCore, parser, args) -> int:
+    """The benchmark loads the show command and the test hunter, so it is imported only for this command"""
+    from metrico.cli.benchmark import SCENARIOS, benchmark
+
+    if unknown := [name for name in args.scenario or [] if name not in SCENARIOS]:
+        parser.error(f"argument --scenario: invalid choice: {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+    return benchmark(metrico, args)
+
+
+def rollups(metrico: MetricoCore, args) -> int:
+    for name in args.tables or list(ROLLUPS):
+        for resolution in args.resolutions or list(RESOLUTIONS):
+            start = time.time()
+            buckets = rollup(metrico, name, resolution, args.chunk_size, args.lookback)
+            console.log(f"Rollup {name} {resolution}: {buckets} buckets updated in {time.time() - start:.2f} sec")
+    return 0
+
+
+def setup(metrico: MetricoCore) -> int:
+    result = metrico.setup()
+    migrations.upgrade(metrico)
+    return result
+
+
 def make_migrations(metrico: MetricoCore, args) -> int:
-    metrico.db.make_migrations(message=args.comment)
+    if args.cli:
+        migrations.make_migrations(metrico, message=args.comment)
+    else:
+        metrico.db.make_migrations(message=args.comment)
     return 0
 
 
 def migrate(metrico: MetricoCore) -> int:
     metrico.db.migrate()
+    migrations.upgrade(metrico)
     return 0
 
 
@@ -126,20 +168,54 @@ def main(metrico: MetricoCore, *argv: str) -> int:
     sub_benchmark.add_argument("--media_count", type=int, default=0)
     sub_benchmark.add_argument("--comment_count", type=int, default=0)
     sub_benchmark.add_argument("--subscription_count", type=int, default=0)
-    sub_benchmark.add_argument("--sqlite", action="store_true")
+    sub_benchmark.add_argument("--sqlite", action="store_true", help="Use the file testing.db instead of sqlite://")
+    sub_benchmark.add_argument("--database", action="append", help="Url of an empty database, repeat it to compare databases, e.g. a local PostgreSQL")
+    sub_benchmark.add_argument("--scenario", nargs="*", help="ingest, update, comments and/or show, default=all, ingest always runs first")
+    sub_benchmark.add_argument("--comment_factor", type=int, default=10, help="Comments per media in the comments scenario, times comments")
+    sub_benchmark.add_argument("--memory", action="store_true", help="Trace the peak memory per phase, slows everything down")
+    sub_benchmark.add_argument("--output", type=str, help="Write the results as json")
+    sub_benchmark.add_argument("--compare", type=str, help="Compare with a json result, exit 1 on regressions")
+    sub_benchmark.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown and more queries for --compare, default=0.2")
+
+    sub_export = subparsers.add_parser("export", help="Export the stats history into a columnar file")
+    export_tables = sub_export.add_subparsers(dest="table", required=True)
+    for name, (_, _, _, add_filter) in EXPORT_TABLES.items():
+        sub_table = add_filter(export_tables.add_parser(name))
+        sub_table.set_defaults(limit=None)
+        sub_table.add_argument("--format", choices=["arrow", "parquet"], default="arrow", help="arrow files can be memory mapped, default=arrow")
+        sub_table.add_argument("--output", type=str, help="default=<table>.<format>")
+        sub_table.add_argument("--chunk_size", type=int, default=50000)
+
+    sub_compact = subparsers.add_parser("compact", help="Remove the stats rows inside of unchanged runs, deltas stay the same")
+    sub_compact.add_argument("table", choices=list(EXPORT_TABLES))
+    sub_compact.add_argument("--chunk_size", type=int, default=1000, help="Accounts/medias per transaction, default=1000")
+    sub_compact.add_argument("--after", type=int, help="Resume after this account/media id")
+
+    sub_rollup = subparsers.add_parser("rollup", help="Update the hourly/daily min/max/last rollups of the stats")
+    sub_rollup.add_argument("--tables", nargs="*", choices=list(ROLLUPS))
+    sub_rollup.add_argument("--resolutions", nargs="*", choices=list(RESOLUTIONS))
+    sub_rollup.add_argument("--chunk_size", type=int, default=100, help="Accounts/medias per transaction, default=100")
+    sub_rollup.add_argument("--lookback", type=parse_timedelta, default="1h", help="Aggregate the stats of this time before the last run again, default=1h")
 
     sub_make_migrations = subparsers.add_parser("make_migrations")
     sub_make_migrations.add_argument("comment", type=str, help="Comment of migration")
-    subparsers.add_parser("migrate")
+    sub_make_migrations.add_argument("--cli", action="store_true", help="Migration of the cli tables and indexes, see metrico.cli.migrations")
+    subparsers.add_parser("migrate", help="Run the core and the cli migrations")
 
     args = parser.parse_args(*argv)
     match args.action:
         case "setup":
-            return metrico.setup()
+            return setup(metrico)
         case "config":
             return config(metrico, args)
         case "benchmark":
-            return benchmark(metrico, args)
+            return run_benchmark(metrico, parser, args)
+        case "export":
+            return export(metrico, args)
+        case "compact":
+            return compact(metrico, args)
+        case "rollup":
+            return rollups(metrico, args)
         case "make_migrations":
             return make_migrations(metrico, args)
         case "migrate":
@@ -0,0 +1,93 @@
+from typing import Callable
+
+import logging
+from threading import Lock
+
+from sqlalchemy import and_, delete, func, select
+
+from metrico import MetricoCore
+from metrico.database import alchemy
+
+logger = logging.getLogger(__name__)
+
+
+def stats_fields(model, owner) -> list:
+    return [column for column in model.__table__.columns if column.key not in ("id", "timestamp", owner.key)]
+
+
+def unchanged_ids(model, owner, ids, tail: int | None = None):
+    """
+    Select the stats rows inside of unchanged runs, the values are equal to the previous and the next row. The first
+    and the last row of each run stay, so the latest, the oldest and the nearest stats to any time keep their values.
+    """
+    fields = stats_fields(model, owner)
+    window = {"partition_by": owner, "order_by": (model.timestamp, model.id)}
+    rows = select(model.id, *fields).where(owner.in_(ids))
+    if tail:
+        numbered = (
+            select(model.id.label("stats_id"), func.row_number().over(partition_by=owner, order_by=(model.timestamp.desc(), model.id.desc())).label("position"))
+            .where(owner.in_(ids))
+            .subquery()
+        )
+        rows = rows.join(numbered, numbered.c.stats_id == model.id).where(numbered.c.position <= tail)
+    neighbours = rows.add_columns(
+        func.lag(model.id).over(**window).label("prev_id"),
+        func.lead(model.id).over(**window).label("next_id"),
+        *[func.lag(field).over(**window).label(f"prev_{field.key}") for field in fields],
+        *[func.lead(field).over(**window).label(f"next_{field.key}") for field in fields],
+    ).subquery()
+    unchanged = [neighbours.c.prev_id.is_not(None), neighbours.c.next_id.is_not(None)]
+    for field in fields:
+        unchanged.append(neighbours.c[field.key].is_not_distinct_from(neighbours.c[f"prev_{field.key}"]))
+        unchanged.append(neighbours.c[field.key].is_not_distinct_from(neighbours.c[f"next_{field.key}"]))
+    return select(neighbours.c.id).where(and_(*unchanged))
+
+
+def compact_stats(session, model, owner, ids, tail: int | None = None) -> int:
+    """Delete the unchanged stats rows of the given owners, or only of their last tail rows"""
+    return session.execute(delete(model).where(model.id.in_(unchanged_ids(model, owner, ids, tail))).execution_options(synchronize_session=False)).rowcount
+
+
+class StatsCompactor:
+    """Store stats only on changes: compact the tail of the stats after every update of a hunt run"""
+
+    tail = 3
+    batch_size = 100
+
+    def __init__(self, metrico: MetricoCore, action: str):
+        self.metrico, self.action = metrico, action
+        self.removed = 0
+        self.pending: list[int] = []
+        self.lock = Lock()
+
+    def wrap(self, update_func: Callable[..., None]) -> Callable[..., None]:
+        def update(obj_id: int, **kwargs):
+            result = update_func(obj_id, **kwargs)
+            with self.lock:
+                self.pending.append(obj_id)
+                if len(self.pending) >= self.batch_size:
+                    self.flush()
+            return result
+
+        return update
+
+    def flush(self):
+        if not self.pending:
+            return
+        with self.metrico.db.Session() as session:
+            self.compact(session, self.pending)
+            session.commit()
+        self.pending = []
+
+    def compact(self, session, obj_ids: list[int]):
+        if self.action in ("account", "accounts"):
+            self.removed += compact_stats(session, alchemy.AccountStats, alchemy.AccountStats.account_id, obj_ids, self.tail)
+            media_ids = select(alchemy.Media.id).where(alchemy.Media.account_id.in_(obj_ids))
+        else:
+            media_ids = obj_ids
+        self.removed += compact_stats(session, alchemy.MediaStats, alchemy.MediaStats.media_id, media_ids, self.tail)
+
+    def close(self):
+        with self.lock:
+            self.flush()
+        logger.info("Removed %s unchanged stats", self.removed)
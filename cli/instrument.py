@@ -0,0 +1,208 @@
+from typing import Any, Callable
+
+import inspect
+import re
+import time
+from collections import defaultdict
+from functools import wraps
+from threading import Lock, local
+
+from rich.table import Table
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from metrico import MetricoCore
+from metrico.cli.limits import http_clients, hunter_methods
+from metrico.cli.utils import console
+
+NORMALIZE_SQL = [
+    (re.compile(r"%\(\w+\)s|(?<![:\w]):\w+|\$\d+"), "?"),
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"\b\d+\b"), "?"),
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)"), "(...)"),
+    (re.compile(r"\s+"), " "),
+]
+
+
+def normalize_sql(statement: str) -> str:
+    """Replace the parameters, literals and expanded IN lists, so equal statements are counted together"""
+    for pattern, replace in NORMALIZE_SQL:
+        statement = pattern.sub(replace, statement)
+    return statement.strip()
+
+
+def timed_calls(hunter) -> list[tuple[Any, str]]:
+    """
+    The calls of a hunter to time: the request method of its HTTP clients, one call per HTTP request. Without a client
+    found, the config.rate_methods of the limits or else the public methods of the hunter.
+    """
+    clients = http_clients(hunter)
+    if clients:
+        return [(client, "request") for client in clients]
+    config = getattr(hunter, "config", None) or {}
+    return [(hunter, name) for name in config.get("rate_methods") or [name for name, _ in hunter_methods(hunter)]]
+
+
+class Instruments:
+    """
+    Count the queries, flushes and commits of all engines and sessions and time the HTTP requests of the hunters.
+    Nothing is hooked until install is called, remove takes everything out again. With details, the time per
+    normalized statement and the latency of every hunter call per platform are kept too. A timed call made within
+    another one, e.g. a hunter method calling the next, is only counted by the outer call.
+    """
+
+    def __init__(self, details: bool = False):
+        self.lock = Lock()
+        self.details = details
+        self.queries = self.flushes = self.commits = self.hunter_calls = 0
+        self.query_time = self.hunter_time = 0.0
+        self.statements: dict[str, list] = defaultdict(lambda: [0, 0.0])
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.wrapped: list[tuple[Any, str, Callable | None]] = []
+        self.calling = local()
+
+    def snapshot(self) -> dict[str, float]:
+        with self.lock:
+            return {
+                "queries": self.queries,
+                "query_time": self.query_time,
+                "flushes": self.flushes,
+                "commits": self.commits,
+                "hunter_calls": self.hunter_calls,
+                "hunter_time": self.hunter_time,
+            }
+
+    def before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info["query_start"].pop()
+        with self.lock:
+            self.queries += 1
+            self.query_time += duration
+        self.add_statement(statement, cursor, parameters, executemany, duration)
+
+    def add_statement(self, statement: str, cursor, parameters, executemany: bool, duration: float):
+        if self.details:
+            key = normalize_sql(statement)
+            with self.lock:
+                self.statements[key][0] += 1
+                self.statements[key][1] += duration
+
+    def after_flush(self, session, flush_context):
+        with self.lock:
+            self.flushes += 1
+
+    def after_commit(self, session):
+        with self.lock:
+            self.commits += 1
+
+    def add_hunter_time(self, duration: float, calls: int = 0):
+        with self.lock:
+            self.hunter_calls += calls
+            self.hunter_time += duration
+
+    def add_latency(self, platform: str, duration: float):
+        if self.details:
+            with self.lock:
+                self.latencies[platform].append(duration)
+
+    def timed_iter(self, platform: str, iterator, duration: float):
+        """The work of a generator happens while iterating, not on the call"""
+        try:
+            while True:
+                if getattr(self.calling, "active", False):
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                    yield item
+                    continue
+                self.calling.active = True
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self.calling.active = False
+                    self.add_hunter_time(time.perf_counter() - start)
+                    duration += time.perf_counter() - start
+                yield item
+        finally:
+            self.add_latency(platform, duration)
+
+    def timed(self, platform: str, func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if getattr(self.calling, "active", False):
+                return func(*args, **kwargs)
+            self.calling.active = True
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                self.calling.active = False
+                duration = time.perf_counter() - start
+                self.add_hunter_time(duration, calls=1)
+            if inspect.isgenerator(result):
+                return self.timed_iter(platform, result, duration)
+            self.add_latency(platform, duration)
+            return result
+
+        return wrapper
+
+    def install(self, metrico: MetricoCore | None = None):
+        event.listen(Engine, "before_cursor_execute", self.before_execute)
+        event.listen(Engine, "after_cursor_execute", self.after_execute)
+        event.listen(Session, "after_flush", self.after_flush)
+        event.listen(Session, "after_commit", self.after_commit)
+        if metrico is not None:
+            for platform, hunter in metrico.hunter.items():
+                for obj, name in timed_calls(hunter):
+                    self.wrapped.append((obj, name, vars(obj).get(name)))
+                    setattr(obj, name, self.timed(platform, getattr(obj, name)))
+
+    def remove(self):
+        event.remove(Engine, "before_cursor_execute", self.before_execute)
+        event.remove(Engine, "after_cursor_execute", self.after_execute)
+        event.remove(Session, "after_flush", self.after_flush)
+        event.remove(Session, "after_commit", self.after_commit)
+        for hunter, name, original in reversed(self.wrapped):
+            if original is None:
+                delattr(hunter, name)
+            else:
+                setattr(hunter, name, original)
+        self.wrapped = []
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """Nearest rank percentile of sorted values"""
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def show_profile(instruments: Instruments, wall: float, top: int = 10):
+    snapshot = instruments.snapshot()
+    console.print(
+        f"Profile: {wall:.2f} sec, {snapshot['queries']} statements in {snapshot['query_time']:.2f} sec, "
+        f"{snapshot['flushes']} flushes, {snapshot['commits']} commits, {snapshot['hunter_calls']} hunter calls in {snapshot['hunter_time']:.2f} sec"
+    )
+    statements = sorted(instruments.statements.items(), key=lambda item: item[1][1], reverse=True)[:top]
+    if statements:
+        table = Table("Count", "Total [s]", "Mean [ms]", "Statement", title=f"Top {top} statements by total time")
+        for statement, (count, total) in statements:
+            table.add_row(f"{count}", f"{total:.3f}", f"{total / count * 1000:.2f}", statement[:200])
+        console.print(table)
+    if instruments.latencies:
+        table = Table("Platform", "Calls", "Total [s]", "p50 [ms]", "p90 [ms]", "p99 [ms]", "Max [ms]", title="Hunter calls")
+        for platform, latencies in sorted(instruments.latencies.items()):
+            values = sorted(latencies)
+            table.add_row(
+                platform,
+                f"{len(values)}",
+                f"{sum(values):.2f}",
+                *[f"{percentile(values, fraction) * 1000:.1f}" for fraction in (0.5, 0.9, 0.99)],
+                f"{values[-1] * 1000:.1f}",
+            )
+        console.print(table)
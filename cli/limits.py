@@ -0,0 +1,231 @@
+from typing import Callable
+
+import inspect
+import logging
+import time
+from datetime import date
+from functools import wraps
+from threading import Lock
+
+from rich.table import Table
+from sqlalchemy import Column, Date, Integer, MetaData, String, and_, insert, select, update
+from sqlalchemy import Table as SqlTable
+from sqlalchemy.exc import IntegrityError
+
+from metrico import MetricoCore
+from metrico.cli.utils import console
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+hunter_quota = SqlTable(
+    "cli_hunter_quota",
+    metadata,
+    Column("platform", String(64), primary_key=True),
+    Column("day", Date, primary_key=True),
+    Column("used", Integer, nullable=False),
+)
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class QuotaUsage:
+    """Calls per platform and day in the database, so every hunt process and daemon takes from the same budget"""
+
+    def __init__(self, metrico: MetricoCore):
+        self.metrico = metrico
+
+    def reserve(self, platform: str, quota: int, block: int) -> int:
+        """
+        Reserve a block of up to block calls of today, the number of calls reserved, 0 if the quota is used up.
+        The conditional update is safe with many processes, which reserve their own blocks.
+        """
+        day = date.today()
+        key = and_(hunter_quota.c.platform == platform, hunter_quota.c.day == day)
+        for _ in range(5):
+            with self.metrico.db.Session() as session:
+                used = session.scalar(select(hunter_quota.c.used).where(key))
+                size = min(block, quota - (used or 0))
+                if size < 1:
+                    return 0
+                if used is None:
+                    try:
+                        session.execute(insert(hunter_quota).values(platform=platform, day=day, used=size))
+                        session.commit()
+                        return size
+                    except IntegrityError:
+                        # another process reserved the first block of the day
+                        session.rollback()
+                        continue
+                stmt = update(hunter_quota).where(key, hunter_quota.c.used <= quota - size).values(used=hunter_quota.c.used + size)
+                if session.execute(stmt).rowcount == 1:
+                    session.commit()
+                    return size
+        return 0
+
+    def release(self, platform: str, day: date, calls: int):
+        """Give back reserved calls that weren't made"""
+        if calls < 1:
+            return
+        with self.metrico.db.Session() as session:
+            key = and_(hunter_quota.c.platform == platform, hunter_quota.c.day == day)
+            session.execute(update(hunter_quota).where(key).values(used=hunter_quota.c.used - calls))
+            session.commit()
+
+    def used(self, platform: str) -> int:
+        with self.metrico.db.Session() as session:
+            stmt = select(hunter_quota.c.used).where(hunter_quota.c.platform == platform, hunter_quota.c.day == date.today())
+            return session.scalar(stmt) or 0
+
+
+class RateLimiter:
+    """
+    Token bucket with rate requests per second and an optional daily quota, shared by all workers of a platform.
+    Workers wait for a token, only an exhausted quota raises QuotaExceeded. The quota is reserved in the database
+    in blocks of quota_block calls and counted down locally, release gives back what's left at the end.
+    """
+
+    def __init__(
+        self,
+        platform: str,
+        rate: float | None = None,
+        burst: int = 1,
+        quota: int | None = None,
+        usage: QuotaUsage | None = None,
+        quota_block: int = 50,
+    ):
+        if quota is not None and usage is None:
+            raise ValueError("a daily quota needs the QuotaUsage of the database")
+        self.platform, self.rate, self.burst, self.quota, self.usage = platform, rate, max(burst, 1), quota, usage
+        self.tokens, self.updated = float(self.burst), time.monotonic()
+        self.quota_block, self.reserved, self.reserved_day = max(quota_block, 1), 0, date.today()
+        self.exhausted: date | None = None
+        self.calls, self.waited = 0, 0.0
+        self.lock = Lock()
+
+    def wait(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if self.rate:
+                    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if not self.rate or self.tokens >= 1:
+                    self.tokens -= 1 if self.rate else 0
+                    return
+                wait = (1 - self.tokens) / self.rate
+                self.waited += wait
+            time.sleep(wait)
+
+    def take(self) -> bool:
+        """One call of the reserved block, reserving the next block if it's used"""
+        with self.lock:
+            today = date.today()
+            if self.reserved_day != today:
+                # yesterday's row is done, its rest doesn't count anymore
+                self.reserved, self.reserved_day = 0, today
+            if not self.reserved:
+                self.reserved = self.usage.reserve(self.platform, self.quota, self.quota_block)
+            if not self.reserved:
+                return False
+            self.reserved -= 1
+            return True
+
+    def acquire(self):
+        if self.exhausted == date.today():
+            raise QuotaExceeded(f"daily quota of {self.quota} calls used")
+        self.wait()
+        if self.quota is not None and self.usage and not self.take():
+            self.exhausted = date.today()
+            raise QuotaExceeded(f"daily quota of {self.quota} calls used")
+        with self.lock:
+            self.calls += 1
+
+    def release(self):
+        with self.lock:
+            if self.usage and self.reserved:
+                self.usage.release(self.platform, self.reserved_day, self.reserved)
+            self.reserved = 0
+
+    def wrap(self, func):
+        @wraps(func)
+        def limited(*args, **kwargs):
+            self.acquire()
+            return func(*args, **kwargs)
+
+        return limited
+
+
+def hunter_methods(hunter) -> list[tuple[str, Callable]]:
+    """Public methods of a hunter, also the ones already wrapped on the instance"""
+    members = inspect.getmembers(hunter, lambda member: inspect.ismethod(member) or inspect.isfunction(member))
+    return [(name, method) for name, method in members if not name.startswith("_")]
+
+
+def http_clients(hunter, depth: int = 2) -> list:
+    """
+    The HTTP sessions (requests.Session, httpx.Client, ...) of a hunter and its API clients, found by their request
+    and send methods. Every API call and every page of a generator goes through their request method once.
+    """
+    found, seen = [], {id(hunter)}
+
+    def visit(obj, level: int):
+        for value in list(vars(obj).values()):
+            if id(value) in seen or inspect.ismodule(value) or inspect.isclass(value):
+                continue
+            seen.add(id(value))
+            if callable(getattr(value, "request", None)) and callable(getattr(value, "send", None)):
+                found.append(value)
+            elif level < depth and hasattr(value, "__dict__"):
+                visit(value, level + 1)
+
+    visit(hunter, 0)
+    return found
+
+
+def limit_hunters(metrico: MetricoCore) -> dict[str, RateLimiter]:
+    """
+    Limit the HTTP requests of every hunter, configured in the hunter config:
+
+        [hunters.youtube]
+        config.rate_limit = 5      # requests per second
+        config.rate_burst = 5
+        config.daily_quota = 10000
+        config.quota_block = 50    # calls reserved from the daily quota at once
+        config.rate_methods = []   # hunter methods with one request each, if its HTTP client isn't found
+    """
+    limiters, usage = {}, QuotaUsage(metrico)
+    for platform, hunter in metrico.hunter.items():
+        config = getattr(hunter, "config", None) or {}
+        if not config.get("rate_limit") and not config.get("daily_quota"):
+            continue
+        limiter = RateLimiter(platform, config.get("rate_limit"), config.get("rate_burst", 1), config.get("daily_quota"), usage, config.get("quota_block", 50))
+        if config.get("rate_methods"):
+            for name in config["rate_methods"]:
+                setattr(hunter, name, limiter.wrap(getattr(hunter, name)))
+        else:
+            clients = http_clients(hunter)
+            if not clients:
+                logger.warning("No HTTP client found in the %s hunter, set config.rate_methods to limit it", platform)
+                continue
+            for client in clients:
+                client.request = limiter.wrap(client.request)
+        limiters[platform] = limiter
+    return limiters
+
+
+def show_limits(limiters: dict[str, RateLimiter]):
+    """Give back the unused reserved quota and show the requests of the run"""
+    if not limiters:
+        return
+    for limiter in limiters.values():
+        limiter.release()
+    table = Table("Platform", "Requests", "Quota used today", "Waited [s]")
+    for platform, limiter in limiters.items():
+        used = limiter.usage.used(platform) if limiter.usage else 0
+        quota = f"{used} of {limiter.quota}" if limiter.quota is not None else f"{used}"
+        table.add_row(platform, f"{limiter.calls}", quota, f"{limiter.waited:.1f}")
+    console.print(table)
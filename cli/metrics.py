@@ -0,0 +1,209 @@
+from typing import Callable
+
+import os
+import re
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict, deque
+from queue import Queue
+from threading import Event, Thread
+
+from rich.live import Live
+from rich.table import Table
+
+from metrico import MetricoCore
+from metrico.cli.instrument import Instruments
+from metrico.cli.utils import console
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+INSERT_TABLE = re.compile(r'^\s*INSERT\s+INTO\s+"?(\w+)', re.IGNORECASE)
+
+WRITE_STATEMENT = re.compile(r"^\s*(INSERT|UPDATE|DELETE)\b", re.IGNORECASE)
+
+
+class Histogram:
+    """Fixed buckets like a Prometheus histogram, the memory stays the same for any number of values"""
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count, self.sum = 0, 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, fraction: float) -> float:
+        """Upper bound of the bucket with the quantile, the last bucket has no bound"""
+        rank, seen = fraction * self.count, 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def lines(self, name: str, labels: str = "") -> list[str]:
+        lines, seen = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            le = "+Inf" if bound == float("inf") else f"{bound}"
+            lines.append(f'{name}_bucket{{{labels}{"," if labels else ""}le="{le}"}} {seen}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class HuntMetrics(Instruments):
+    """
+    Counters and histograms of a hunt run: items done/failed/in flight, API requests and latency per platform, database
+    write latency, queue depth and inserted rows per table. Shown as live panel and/or written to a Prometheus text
+    file, which the node exporter textfile collector can scrape.
+    """
+
+    def __init__(self, action: str, window: float = 10.0):
+        super().__init__()
+        self.action = action
+        self.done = self.failed = self.in_flight = 0
+        self.api: dict[str, Histogram] = defaultdict(Histogram)
+        self.writes = Histogram()
+        self.rows: Counter[str] = Counter()
+        self.queue: Queue | None = None
+        self.started = self.last_done = time.time()
+        self.window = window
+        self.samples: deque[tuple[float, int]] = deque()
+        self.stop = Event()
+        self.live: Live | None = None
+        self.writer: Thread | None = None
+        self.filename: str | None = None
+
+    def add_latency(self, platform: str, duration: float):
+        with self.lock:
+            self.api[platform].observe(duration)
+
+    def add_statement(self, statement: str, cursor, parameters, executemany: bool, duration: float):
+        if not WRITE_STATEMENT.match(statement):
+            return
+        with self.lock:
+            self.writes.observe(duration)
+            if match := INSERT_TABLE.match(statement):
+                rows = cursor.rowcount
+                if rows is None or rows < 0:
+                    rows = len(parameters) if executemany else 1
+                self.rows[match.group(1)] += rows
+
+    def wrap(self, update_func: Callable[..., None]) -> Callable[..., None]:
+        def update(obj_id: int, **kwargs):
+            with self.lock:
+                self.in_flight += 1
+            try:
+                result = update_func(obj_id, **kwargs)
+            except Exception:
+                with self.lock:
+                    self.failed += 1
+                raise
+            else:
+                with self.lock:
+                    self.done += 1
+                    self.last_done = time.time()
+                return result
+            finally:
+                with self.lock:
+                    self.in_flight -= 1
+
+        return update
+
+    def rate(self) -> float:
+        """Items per second within the last window seconds, drops to 0 when the run stalls"""
+        now = time.time()
+        with self.lock:
+            self.samples.append((now, self.done + self.failed))
+            while len(self.samples) > 1 and self.samples[0][0] < now - self.window:
+                self.samples.popleft()
+            (first, first_count), (last, last_count) = self.samples[0], self.samples[-1]
+        return (last_count - first_count) / (last - first) if last > first else 0.0
+
+    def render(self) -> Table:
+        now = time.time()
+        table = Table("Metric", "Value", title=f"hunt {self.action}", expand=False)
+        table.add_row("Elapsed", f"{now - self.started:.0f} sec")
+        table.add_row("Done / failed", f"{self.done} / {self.failed}")
+        table.add_row("Items/sec", f"{self.rate():.1f} (total {self.done / max(now - self.started, 1e-6):.1f})")
+        table.add_row("In flight / queued", f"{self.in_flight} / {self.queue.qsize() if self.queue is not None else '-'}")
+        table.add_row("Last item", f"{now - self.last_done:.0f} sec ago")
+        with self.lock:
+            for platform, histogram in sorted(self.api.items()):
+                table.add_row(f"API {platform}", f"{histogram.count} calls, p50 <{histogram.quantile(0.5)}s, p90 <{histogram.quantile(0.9)}s")
+            table.add_row("DB writes", f"{self.writes.count}, p50 <{self.writes.quantile(0.5)}s, p90 <{self.writes.quantile(0.9)}s")
+            for name, rows in sorted(self.rows.items()):
+                table.add_row(f"Rows {name}", f"{rows}")
+        return table
+
+    def prometheus(self) -> str:
+        labels = f'action="{self.action}"'
+        lines = [
+            "# HELP metrico_hunt_items_total Updated items of the hunt run.",
+            "# TYPE metrico_hunt_items_total counter",
+            f'metrico_hunt_items_total{{{labels},status="done"}} {self.done}',
+            f'metrico_hunt_items_total{{{labels},status="failed"}} {self.failed}',
+            "# HELP metrico_hunt_in_flight Items updated right now.",
+            "# TYPE metrico_hunt_in_flight gauge",
+            f"metrico_hunt_in_flight{{{labels}}} {self.in_flight}",
+            "# HELP metrico_hunt_queue_depth Ids waiting for a worker.",
+            "# TYPE metrico_hunt_queue_depth gauge",
+            f"metrico_hunt_queue_depth{{{labels}}} {self.queue.qsize() if self.queue is not None else 0}",
+            "# HELP metrico_hunt_last_item_timestamp_seconds Time of the last finished item, for stall alerts.",
+            "# TYPE metrico_hunt_last_item_timestamp_seconds gauge",
+            f"metrico_hunt_last_item_timestamp_seconds{{{labels}}} {self.last_done}",
+            "# HELP metrico_hunt_start_timestamp_seconds Start of the hunt run.",
+            "# TYPE metrico_hunt_start_timestamp_seconds gauge",
+            f"metrico_hunt_start_timestamp_seconds{{{labels}}} {self.started}",
+            "# HELP metrico_hunt_api_call_seconds Latency of the HTTP requests of the hunters.",
+            "# TYPE metrico_hunt_api_call_seconds histogram",
+        ]
+        with self.lock:
+            for platform, histogram in sorted(self.api.items()):
+                lines += histogram.lines("metrico_hunt_api_call_seconds", f'{labels},platform="{platform}"')
+            lines += [
+                "# HELP metrico_hunt_db_write_seconds Latency of the insert, update and delete statements.",
+                "# TYPE metrico_hunt_db_write_seconds histogram",
+            ]
+            lines += self.writes.lines("metrico_hunt_db_write_seconds", labels)
+            lines += ["# HELP metrico_hunt_rows_inserted_total Inserted rows per table.", "# TYPE metrico_hunt_rows_inserted_total counter"]
+            for name, rows in sorted(self.rows.items()):
+                lines.append(f'metrico_hunt_rows_inserted_total{{{labels},table="{name}"}} {rows}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, filename: str):
+        """Write to a temporary file and rename it, so the collector never reads half a file"""
+        temporary = f"{filename}.{os.getpid()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            file.write(self.prometheus())
+        os.replace(temporary, filename)
+
+    def start(self, metrico: MetricoCore, progress: bool = False, filename: str | None = None, interval: float = 15.0):
+        self.install(metrico)
+        if progress:
+            self.live = Live(console=console, refresh_per_second=2, transient=True, get_renderable=self.render)
+            self.live.__enter__()
+        if filename:
+            self.filename = filename
+
+            def write_periodically():
+                while not self.stop.wait(interval):
+                    self.write(filename)
+
+            self.writer = Thread(target=write_periodically, daemon=True)
+            self.writer.start()
+
+    def close(self):
+        self.stop.set()
+        if self.writer is not None:
+            self.writer.join()
+        if self.filename:
+            self.write(self.filename)
+        if self.live is not None:
+            self.live.__exit__(None, None, None)
+            console.print(self.render())
+        self.remove()
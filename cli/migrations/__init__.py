@@ -0,0 +1,68 @@
+"""
+Alembic environment of the tables and indexes the cli adds next to the core schema. The revisions have their own
+version table, so they never mix with the core migrations. Use exclude_cli_objects as include_object of the core
+environment, then its autogenerate doesn't propose to drop them.
+"""
+
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import MetaData
+
+from metrico import MetricoCore
+
+VERSION_TABLE = "cli_alembic_version"
+
+CLI_INDEXES = {
+    "ix_account_stats_timestamp",
+    "ix_account_stats_account_id_timestamp",
+    "ix_media_stats_timestamp",
+    "ix_media_stats_media_id_timestamp",
+}
+
+
+def target_metadata() -> list[MetaData]:
+    """The MetaData of the cli modules, imported here, so the modules themselves don't need alembic"""
+    from metrico.cli import checkpoint, limits, rollup
+    from metrico.cli.cmd import daemon
+
+    return [limits.metadata, checkpoint.metadata, rollup.metadata, daemon.metadata]
+
+
+def cli_tables() -> set[str]:
+    return {name for metadata in target_metadata() for name in metadata.tables} | {VERSION_TABLE}
+
+
+def include_object(obj, name, type_, reflected, compare_to) -> bool:
+    """include_object of the cli environment, the core tables belong to the core migrations"""
+    if type_ == "table":
+        return name in cli_tables()
+    return True
+
+
+def exclude_cli_objects(obj, name, type_, reflected, compare_to) -> bool:
+    """include_object for the core environment"""
+    if type_ == "table":
+        return name not in cli_tables()
+    if type_ == "index":
+        return name not in CLI_INDEXES
+    return True
+
+
+def get_config(connection) -> Config:
+    config = Config()
+    config.set_main_option("script_location", str(Path(__file__).parent))
+    config.attributes["connection"] = connection
+    return config
+
+
+def upgrade(metrico: MetricoCore, revision: str = "head"):
+    with metrico.db.Session() as session:
+        command.upgrade(get_config(session.connection()), revision)
+        session.commit()
+
+
+def make_migrations(metrico: MetricoCore, message: str):
+    with metrico.db.Session() as session:
+        command.revision(get_config(session.connection()), message=message, autogenerate=True)
@@ -0,0 +1,15 @@
+from alembic import context
+
+from metrico.cli.migrations import VERSION_TABLE, include_object, target_metadata
+
+if context.is_offline_mode():
+    raise RuntimeError("The cli migrations run on the connection of the MetricoCore, run them with: metrico tools migrate")
+
+context.configure(
+    connection=context.config.attributes["connection"],
+    target_metadata=target_metadata(),
+    include_object=include_object,
+    version_table=VERSION_TABLE,
+)
+with context.begin_transaction():
+    context.run_migrations()
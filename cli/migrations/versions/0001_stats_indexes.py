@@ -0,0 +1,33 @@
+"""stats time series indexes
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    "ix_account_stats_timestamp": ("account_stats", ["timestamp"]),
+    "ix_account_stats_account_id_timestamp": ("account_stats", ["account_id", "timestamp"]),
+    "ix_media_stats_timestamp": ("media_stats", ["timestamp"]),
+    "ix_media_stats_media_id_timestamp": ("media_stats", ["media_id", "timestamp"]),
+}
+
+
+def upgrade() -> None:
+    for name, (table, columns) in INDEXES.items():
+        op.create_index(name, table, columns)
+
+
+def downgrade() -> None:
+    for name, (table, _) in INDEXES.items():
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,29 @@
+"""daily quota per hunter
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "cli_hunter_quota",
+        sa.Column("platform", sa.String(64), primary_key=True),
+        sa.Column("day", sa.Date, primary_key=True),
+        sa.Column("used", sa.Integer, nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("cli_hunter_quota")
@@ -0,0 +1,47 @@
+"""checkpoint and lease queue of hunt runs
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "cli_hunt_run",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("argv", sa.JSON, nullable=False),
+        sa.Column("started", sa.DateTime, nullable=False),
+        sa.Column("finished", sa.DateTime),
+    )
+    op.create_table(
+        "cli_hunt_run_item",
+        sa.Column("run_id", sa.Integer, sa.ForeignKey("cli_hunt_run.id"), primary_key=True),
+        sa.Column("obj_id", sa.Integer, primary_key=True),
+    )
+    op.create_table(
+        "cli_hunt_task",
+        sa.Column("run_id", sa.Integer, sa.ForeignKey("cli_hunt_run.id"), primary_key=True),
+        sa.Column("obj_id", sa.Integer, primary_key=True),
+        sa.Column("position", sa.Integer, nullable=False),
+        sa.Column("lease", sa.String(128)),
+        sa.Column("lease_until", sa.DateTime),
+        sa.Column("done", sa.Boolean, nullable=False),
+    )
+    op.create_index("ix_cli_hunt_task_lease", "cli_hunt_task", ["lease"])
+
+
+def downgrade() -> None:
+    op.drop_table("cli_hunt_task")
+    op.drop_table("cli_hunt_run_item")
+    op.drop_table("cli_hunt_run")
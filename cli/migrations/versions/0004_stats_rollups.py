@@ -0,0 +1,51 @@
+"""stats rollups
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+ROLLUPS = {
+    "account_stats": ["medias", "views", "followers", "subscriptions"],
+    "media_stats": ["comments", "likes", "views"],
+}
+
+
+def upgrade() -> None:
+    op.create_table(
+        "cli_rollup_state",
+        sa.Column("name", sa.String(64), primary_key=True),
+        sa.Column("resolution", sa.String(8), primary_key=True),
+        sa.Column("last_id", sa.Integer, nullable=False),
+        sa.Column("last_run", sa.DateTime),
+        sa.Column("running_until", sa.DateTime),
+    )
+    inspector = sa.inspect(op.get_bind())
+    for name, fields in ROLLUPS.items():
+        # the value columns have the types of the stats columns
+        types = {column["name"]: column["type"] for column in inspector.get_columns(name)}
+        op.create_table(
+            f"cli_{name}_rollup",
+            sa.Column("owner_id", sa.Integer, primary_key=True),
+            sa.Column("resolution", sa.String(8), primary_key=True),
+            sa.Column("bucket", sa.DateTime, primary_key=True),
+            sa.Column("samples", sa.Integer, nullable=False),
+            sa.Column("last_timestamp", sa.DateTime, nullable=False),
+            *[sa.Column(f"{kind}_{field}", types[field]) for field in fields for kind in ("min", "max", "last")],
+        )
+
+
+def downgrade() -> None:
+    for name in ROLLUPS:
+        op.drop_table(f"cli_{name}_rollup")
+    op.drop_table("cli_rollup_state")
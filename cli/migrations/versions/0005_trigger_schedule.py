@@ -0,0 +1,39 @@
+"""trigger schedules of the daemon
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+from metrico.database import alchemy
+
+# revision identifiers, used by Alembic.
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "cli_trigger_schedule",
+        sa.Column("trigger_id", sa.Integer, sa.ForeignKey(f"{alchemy.Trigger.__tablename__}.id"), primary_key=True),
+        sa.Column("interval", sa.Float, nullable=False),
+        sa.Column("threads", sa.Integer, nullable=False),
+        sa.Column("limit", sa.Integer, nullable=False),
+        sa.Column("enabled", sa.Boolean, nullable=False),
+        sa.Column("next_run", sa.DateTime, nullable=False),
+        sa.Column("runs", sa.Integer, nullable=False),
+        sa.Column("last_duration", sa.Float),
+        sa.Column("last_status", sa.Integer),
+        sa.Column("lease", sa.String(128)),
+        sa.Column("lease_until", sa.DateTime),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("cli_trigger_schedule")
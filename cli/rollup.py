@@ -0,0 +1,152 @@
+from typing import Any
+
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, and_, delete, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from metrico import MetricoCore
+from metrico.cli.checkpoint import db_now
+from metrico.database import alchemy
+
+logger = logging.getLogger(__name__)
+
+RESOLUTIONS = {"1h": timedelta(hours=1), "1d": timedelta(days=1)}
+
+BUCKET_EPOCH = datetime(2000, 1, 1)
+
+# stats committed late, by long hunt transactions, have an id below the watermark, so the stats of this time
+# before the last run are aggregated again
+LATE_COMMIT_LOOKBACK = timedelta(hours=1)
+
+# a run holds the state row this long, renewed after every chunk, a crashed run frees it after the lease
+ROLLUP_LEASE = timedelta(minutes=10)
+
+metadata = MetaData()
+
+rollup_state = Table(
+    "cli_rollup_state",
+    metadata,
+    Column("name", String(64), primary_key=True),
+    Column("resolution", String(8), primary_key=True),
+    Column("last_id", Integer, nullable=False),
+    Column("last_run", DateTime),
+    Column("running_until", DateTime),
+)
+
+
+def rollup_table(name: str, model, fields: list[str]) -> Table:
+    columns = [Column(f"{kind}_{field}", model.__table__.c[field].type) for field in fields for kind in ("min", "max", "last")]
+    return Table(
+        f"cli_{name}_rollup",
+        metadata,
+        Column("owner_id", Integer, primary_key=True),
+        Column("resolution", String(8), primary_key=True),
+        Column("bucket", DateTime, primary_key=True),
+        Column("samples", Integer, nullable=False),
+        Column("last_timestamp", DateTime, nullable=False),
+        *columns,
+    )
+
+
+ROLLUPS = {
+    "account_stats": (alchemy.AccountStats, alchemy.AccountStats.account_id, ["medias", "views", "followers", "subscriptions"]),
+    "media_stats": (alchemy.MediaStats, alchemy.MediaStats.media_id, ["comments", "likes", "views"]),
+}
+
+ROLLUP_TABLES = {name: rollup_table(name, model, fields) for name, (model, _, fields) in ROLLUPS.items()}
+
+
+def bucket_start(timestamp: datetime, resolution: timedelta) -> datetime:
+    return BUCKET_EPOCH + ((timestamp - BUCKET_EPOCH) // resolution) * resolution
+
+
+def aggregate(rows, fields: list[str], resolution: str) -> list[dict[str, Any]]:
+    """min/max/last of the fields per (owner, bucket), rows ordered by owner and timestamp"""
+    buckets: dict[tuple[int, datetime], dict[str, Any]] = {}
+    for row in rows:
+        key = (row.owner_id, bucket_start(row.timestamp, RESOLUTIONS[resolution]))
+        if key not in buckets:
+            buckets[key] = {"owner_id": key[0], "resolution": resolution, "bucket": key[1], "samples": 0}
+            buckets[key].update({f"{kind}_{field}": None for field in fields for kind in ("min", "max")})
+        bucket = buckets[key]
+        bucket["samples"] += 1
+        bucket["last_timestamp"] = row.timestamp
+        for field in fields:
+            value = getattr(row, field)
+            bucket[f"last_{field}"] = value
+            if value is not None:
+                bucket[f"min_{field}"] = value if bucket[f"min_{field}"] is None else min(bucket[f"min_{field}"], value)
+                bucket[f"max_{field}"] = value if bucket[f"max_{field}"] is None else max(bucket[f"max_{field}"], value)
+    return list(buckets.values())
+
+
+def claim_rollup(metrico: MetricoCore, name: str, resolution: str) -> bool:
+    """Lease the state row of the rollup in the time of the database, False if another run holds it"""
+    state = and_(rollup_state.c.name == name, rollup_state.c.resolution == resolution)
+    with metrico.db.Session() as session:
+        if session.scalar(select(rollup_state.c.name).where(state)) is None:
+            try:
+                session.execute(insert(rollup_state).values(name=name, resolution=resolution, last_id=0))
+                session.commit()
+            except IntegrityError:
+                # another run created the row first
+                session.rollback()
+        now = db_now(session)
+        free = or_(rollup_state.c.running_until.is_(None), rollup_state.c.running_until < now)
+        result = session.execute(update(rollup_state).where(state, free).values(running_until=now + ROLLUP_LEASE))
+        session.commit()
+    return result.rowcount == 1
+
+
+def rollup(metrico: MetricoCore, name: str, resolution: str, chunk_size: int = 100, lookback: timedelta = LATE_COMMIT_LOOKBACK) -> int:
+    """
+    Bring the rollup up to date. Only the buckets of stats added since the last run, or within the lookback before
+    it, are computed again, from their first new bucket on, so a run after a hunt only reads the latest stats.
+    Concurrent runs of the same rollup are skipped, one run holds the lease of its state row.
+    """
+    if not claim_rollup(metrico, name, resolution):
+        logger.info("Rollup %s %s is running in another process, skipped", name, resolution)
+        return 0
+    model, owner, fields = ROLLUPS[name]
+    table = ROLLUP_TABLES[name]
+    state = and_(rollup_state.c.name == name, rollup_state.c.resolution == resolution)
+    buckets, starts = 0, []
+    started = datetime.now()
+    with metrico.db.Session() as session:
+        try:
+            last_id, last_run = session.execute(select(rollup_state.c.last_id, rollup_state.c.last_run).where(state)).one()
+            max_id = session.scalar(select(func.max(model.id))) or 0
+            changed = model.id > last_id
+            if last_run is not None:
+                changed = or_(changed, model.timestamp >= last_run - lookback)
+            new = select(owner, func.min(model.timestamp)).where(changed, model.id <= max_id).group_by(owner).order_by(owner)
+            starts = [(owner_id, bucket_start(timestamp, RESOLUTIONS[resolution])) for owner_id, timestamp in session.execute(new)]
+            for index in range(0, len(starts), chunk_size):
+                chunk = starts[index : index + chunk_size]
+                stmt = (
+                    select(owner.label("owner_id"), model.timestamp, *[getattr(model, field) for field in fields])
+                    .where(or_(*[and_(owner == owner_id, model.timestamp >= start) for owner_id, start in chunk]))
+                    .order_by(owner, model.timestamp, model.id)
+                )
+                rows = aggregate(session.execute(stmt), fields, resolution)
+                session.execute(
+                    delete(table).where(
+                        table.c.resolution == resolution, or_(*[and_(table.c.owner_id == owner_id, table.c.bucket >= start) for owner_id, start in chunk])
+                    )
+                )
+                if rows:
+                    session.execute(insert(table), rows)
+                session.execute(update(rollup_state).where(state).values(running_until=db_now(session) + ROLLUP_LEASE))
+                session.commit()
+                buckets += len(rows)
+            session.execute(update(rollup_state).where(state).values(last_id=max_id, last_run=started, running_until=None))
+            session.commit()
+        except BaseException:
+            session.rollback()
+            session.execute(update(rollup_state).where(state).values(running_until=None))
+            session.commit()
+            raise
+    logger.info("Rollup %s %s: %s owners, %s buckets", name, resolution, len(starts), buckets)
+    return buckets
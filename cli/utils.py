@@ -1,13 +1,26 @@
-from argparse import ArgumentParser
-from datetime import datetime
+import csv
+import json
+import sys
+import time
+from argparse import ArgumentParser, ArgumentTypeError
+from collections import deque
+from datetime import datetime, timedelta
+from threading import Lock
 
 from rich.console import Console
+from rich.live import Live
+from rich.table import Column, Table
 
 from metrico.database.query import AccountOrder, MediaCommentOrder, MediaOrder
 from metrico.models import ModelStatus
 
 console = Console()
 
+ACCOUNT_GROWTH = ["medias", "views", "followers", "subscriptions"]
+MEDIA_GROWTH = ["comments", "likes", "views"]
+FORMATS = ["csv", "jsonl", "tsv"]
+TIME_UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+
 
 class MetricoArgumentParser(ArgumentParser):
     def __init__(self, prog):
@@ -17,6 +30,111 @@ class MetricoArgumentParser(ArgumentParser):
         return super().parse_args(args=argv)
 
 
+class LiveTable:
+    """
+    Live table with a bounded number of rows. Full pages are printed once and dropped from the live view, in tail
+    mode only the last rows are kept. So a refresh costs the same, no matter how many rows were added.
+    """
+
+    def __init__(self, *headers, page_size: int = 100, tail: bool = False, **kwargs):
+        self.headers, self.kwargs = headers, kwargs
+        self.page_size, self.tail = page_size, tail
+        self.rows: deque[tuple] = deque(maxlen=page_size if tail else None)
+        self.count, self.start = 0, time.time()
+        self.lock = Lock()
+        self.live = Live(console=console, refresh_per_second=4, transient=True, get_renderable=self.render)
+
+    def __enter__(self):
+        self.start = time.time()
+        self.live.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self.live.__exit__(*exc)
+        console.print(self.render())
+
+    def render(self) -> Table:
+        headers = [header.copy() if isinstance(header, Column) else header for header in self.headers]
+        seconds = max(time.time() - self.start, 1e-6)
+        table = Table(*headers, caption=f"{self.count} rows | {self.count / seconds:.1f} rows/sec", **self.kwargs)
+        with self.lock:
+            for row in self.rows:
+                table.add_row(*row)
+        return table
+
+    def add_row(self, *values):
+        if not self.tail and len(self.rows) >= self.page_size:
+            self.live.console.print(self.render())
+            with self.lock:
+                self.rows.clear()
+        with self.lock:
+            self.rows.append(values)
+        self.count += 1
+
+
+class StreamWriter:
+    """Write the raw rows as csv, tsv or json lines to stdout, nothing is truncated or rendered"""
+
+    def __init__(self, fmt: str, fields: list[str]):
+        self.fmt, self.fields = fmt, fields
+        self.writer = csv.writer(sys.stdout, delimiter="\t" if fmt == "tsv" else ",", lineterminator="\n")
+
+    def __enter__(self):
+        if self.fmt != "jsonl":
+            self.writer.writerow(self.fields)
+        return self
+
+    def __exit__(self, *exc):
+        sys.stdout.flush()
+
+    def add_row(self, *values):
+        if self.fmt == "jsonl":
+            sys.stdout.write(json.dumps(dict(zip(self.fields, values)), default=str) + "\n")
+        else:
+            self.writer.writerow(values)
+
+
+def open_table(args, headers: list, fields: list[str], **kwargs):
+    if getattr(args, "format", None):
+        return StreamWriter(args.format, fields)
+    return LiveTable(*headers, page_size=args.page_size, tail=args.tail, **kwargs)
+
+
+FIRST_PAGE = "first"
+
+
+def parse_cursor(value: str) -> tuple[str, int]:
+    key, _, obj_id = value.rpartition(",")
+    return key, int(obj_id)
+
+
+def print_next_cursor(*keys):
+    print(f"Next page: --after {','.join(str(key) for key in keys)}", file=sys.stderr)
+
+
+def parse_timedelta(value: str) -> timedelta:
+    try:
+        return timedelta(**{TIME_UNITS[value[-1]]: float(value[:-1])})
+    except (KeyError, IndexError, ValueError) as exc:
+        raise ArgumentTypeError(f"invalid time window '{value}', use something like 30m, 24h or 7d") from exc
+
+
+def order_type(order, growth: list[str] | None = None):
+    def parse(value: str):
+        if growth and value.startswith("growth_") and value.removeprefix("growth_") in growth:
+            return value
+        return order[value]
+
+    return parse
+
+
+def parser_add_argument_live(parser):
+    parser.add_argument("--page_size", type=int, default=100, help="Rows of the live table, full pages are printed once, default=100")
+    parser.add_argument("--tail", action="store_true", help="Only keep the last page_size rows")
+    parser.add_argument("--format", choices=FORMATS, help="Stream the raw rows to stdout instead of a table")
+    return parser
+
+
 def parser_add_argument_basic_filter(parser):
     parser.add_argument("--limit", type=int, default=20)
     parser.add_argument("--offset", type=int)
@@ -28,9 +146,27 @@ def parser_add_argument_basic_filter(parser):
     return parser
 
 
-def parser_add_argument_account_filter(parser):
+def parser_add_argument_growth(parser):
+    parser.add_argument("--window", type=parse_timedelta, default="24h", help="Time window for the growth_* orders, default=24h")
+    return parser
+
+
+def parser_add_argument_cursor(parser):
+    parser.add_argument(
+        "--after",
+        type=str,
+        help=f"Keyset cursor 'order key,id' of the next page, printed after a full page, '{FIRST_PAGE}' starts at the first page, replaces --offset",
+    )
+    return parser
+
+
+def parser_add_argument_account_filter(parser, growth: bool = False):
     parser = parser_add_argument_basic_filter(parser)
-    parser.add_argument("--order_by", type=lambda x: AccountOrder[x], choices=list(AccountOrder))
+    choices: list = list(AccountOrder)
+    if growth:
+        parser = parser_add_argument_growth(parser)
+        choices += [f"growth_{name}" for name in ACCOUNT_GROWTH]
+    parser.add_argument("--order_by", type=order_type(AccountOrder, ACCOUNT_GROWTH if growth else None), choices=choices)
     parser.add_argument("--filter_stats_null", action="store_true")
     parser.add_argument("--filter_stats_views_null", action="store_true")
     parser.add_argument("--filter_comment_media_id", nargs="*", type=int)
@@ -38,9 +174,13 @@ def parser_add_argument_account_filter(parser):
     return parser
 
 
-def parser_add_argument_media_filter(parser):
+def parser_add_argument_media_filter(parser, growth: bool = False):
     parser = parser_add_argument_basic_filter(parser)
-    parser.add_argument("--order_by", type=lambda x: MediaOrder[x], choices=list(MediaOrder))
+    choices: list = list(MediaOrder)
+    if growth:
+        parser = parser_add_argument_growth(parser)
+        choices += [f"growth_{name}" for name in MEDIA_GROWTH]
+    parser.add_argument("--order_by", type=order_type(MediaOrder, MEDIA_GROWTH if growth else None), choices=choices)
     return parser
 
 
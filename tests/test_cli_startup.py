@@ -0,0 +1,51 @@
+import subprocess
+import sys
+
+# cumulative import time of metrico --help, the CLI starts without the core, SQLAlchemy and the hunters
+IMPORT_BUDGET_US = 100_000
+
+HELP = """
+import io
+import sys
+from contextlib import redirect_stdout
+sys.argv = ["metrico", "--help"]
+from metrico.cli.__main__ import main
+with redirect_stdout(io.StringIO()):
+    try:
+        main()
+    except SystemExit:
+        pass
+"""
+
+
+def loaded_modules(code: str, *names: str) -> list[str]:
+    """Run the code in a fresh interpreter, return the given modules it imported"""
+    check = f"import sys\n{code}\nprint(' '.join(name for name in {names!r} if name in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", check], capture_output=True, text=True, check=True)
+    return result.stdout.split()
+
+
+def top_level_imports(code: str) -> dict[str, int]:
+    """Cumulative -X importtime in microseconds of the imports the code runs at the top level"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True)
+    imports = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            if not name.startswith("  ") and cumulative.strip().isdigit():
+                imports[name.strip()] = int(cumulative)
+    return imports
+
+
+def test_help_without_core():
+    assert loaded_modules(HELP, "sqlalchemy", "metrico.cli.cmd.show", "metrico.cli.cmd.hunt") == []
+
+
+def test_tools_without_benchmark():
+    assert loaded_modules("import metrico.cli.cmd.tools", "metrico.cli.benchmark", "metrico.cli.cmd.show") == []
+
+
+def test_help_import_time():
+    interpreter = top_level_imports("pass")
+    imports = {name: cumulative for name, cumulative in top_level_imports(HELP).items() if name not in interpreter}
+    assert sum(imports.values()) < IMPORT_BUDGET_US, sorted(imports.items(), key=lambda item: -item[1])[:10]